@@ -1,10 +1,101 @@
+"use client"
+
+import { useEffect, useState } from "react"
 import { Card, CardContent } from "@/components/ui/card"
 
 interface GeneratedPostsProps {
-  posts: string[]
+  posts?: string[]
+  // Chunks to generate posts for; each post is streamed in as it is written
+  chunks?: string[]
+}
+
+interface StreamedPost {
+  text: string
+  done: boolean
+  error: string | null
+}
+
+// Streams one post from /api/generate-stream, updating as text deltas arrive.
+// Unmounting aborts the request, which stops generation on the server.
+function useStreamedPost(chunk: string): StreamedPost {
+  const [post, setPost] = useState<StreamedPost>({ text: "", done: false, error: null })
+
+  useEffect(() => {
+    const controller = new AbortController()
+    setPost({ text: "", done: false, error: null })
+
+    const run = async () => {
+      const response = await fetch("/api/generate-stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ chunk }),
+        signal: controller.signal,
+      })
+      if (!response.ok || !response.body) {
+        const body = await response.json().catch(() => ({}))
+        throw new Error(body.error || `Server error: ${response.status}`)
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ""
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        // Server-Sent Events are separated by a blank line
+        let boundary = buffer.indexOf("\n\n")
+        while (boundary !== -1) {
+          const raw = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+          boundary = buffer.indexOf("\n\n")
+
+          const event = raw.match(/^event: (.*)$/m)?.[1]
+          const data = raw.match(/^data: (.*)$/m)?.[1]
+          if (!event || data === undefined) continue
+          const payload = JSON.parse(data)
+          if (event === "delta") {
+            setPost((prev) => ({ ...prev, text: prev.text + payload.text }))
+          } else if (event === "error") {
+            throw new Error(payload.error)
+          }
+        }
+      }
+      setPost((prev) => ({ ...prev, done: true }))
+    }
+
+    run().catch((error) => {
+      if (controller.signal.aborted) return
+      console.error("Error streaming post:", error)
+      setPost((prev) => ({ ...prev, done: true, error: "Failed to generate this post." }))
+    })
+
+    return () => controller.abort()
+  }, [chunk])
+
+  return post
+}
+
+function StreamingPostCard({ chunk }: { chunk: string }) {
+  const { text, done, error } = useStreamedPost(chunk)
+
+  return (
+    <Card className="bg-card/50">
+      <CardContent className="p-3">
+        {error ? (
+          <p className="text-sm text-red-500">{error}</p>
+        ) : (
+          <p className="text-sm text-muted-foreground whitespace-pre-wrap">
+            {text || (done ? "" : "Writing...")}
+          </p>
+        )}
+      </CardContent>
+    </Card>
+  )
 }
 
-export function GeneratedPosts({ posts }: GeneratedPostsProps) {
+export function GeneratedPosts({ posts = [], chunks = [] }: GeneratedPostsProps) {
   return (
     <div className="space-y-3">
       <h3 className="text-sm font-medium">Generated Posts</h3>
@@ -16,8 +107,10 @@ export function GeneratedPosts({ posts }: GeneratedPostsProps) {
             </CardContent>
           </Card>
         ))}
+        {chunks.map((chunk, index) => (
+          <StreamingPostCard key={`chunk-${index}`} chunk={chunk} />
+        ))}
       </div>
     </div>
   )
 }
-
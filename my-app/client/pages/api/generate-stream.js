@@ -0,0 +1,69 @@
+export const config = {
+  api: {
+    bodyParser: false,  // Forward the JSON body untouched
+    responseLimit: false,  // The response is a long-lived event stream
+  },
+};
+
+export default async function handler(req, res) {
+  if (req.method !== 'POST') {
+    return res.status(405).json({ error: 'Method not allowed' });
+  }
+
+  // Abort the Flask request (and with it the model stream) if the browser goes away
+  const controller = new AbortController();
+  res.on('close', () => controller.abort());
+
+  try {
+    const chunks = [];
+    for await (const chunk of req) {
+      chunks.push(chunk);
+    }
+    const body = Buffer.concat(chunks);
+
+    const flaskResponse = await fetch('http://127.0.0.1:5000/generate/stream', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body,
+      signal: controller.signal,
+    });
+
+    if (!flaskResponse.ok) {
+      const error = await flaskResponse.json().catch(() => ({}));
+      return res.status(flaskResponse.status).json({
+        error: error.error || `Failed to generate post: ${flaskResponse.status} - ${flaskResponse.statusText}`,
+      });
+    }
+
+    res.writeHead(200, {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache, no-transform',
+      'Connection': 'keep-alive',
+    });
+
+    // Relay each event to the browser as soon as Flask sends it
+    const reader = flaskResponse.body.getReader();
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      res.write(Buffer.from(value));
+    }
+    res.end();
+
+  } catch (error) {
+    if (controller.signal.aborted) {
+      return;
+    }
+    console.error('Error streaming post:', error);
+
+    if (res.headersSent) {
+      res.end();
+    } else if (error instanceof Error) {
+      res.status(500).json({ error: error.message });
+    } else {
+      res.status(500).json({ error: 'Unknown error occurred' });
+    }
+  }
+}
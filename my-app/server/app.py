@@ -1,41 +1,105 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 import os
-import subprocess
+import json
 from datetime import datetime
-from io import BytesIO
-import zipfile
 import shutil
-from filter_chunks import filter_chunks  # Import the filtering function
+import tempfile
+import time
+import uuid
+from itertools import chain
+import chunking_service
+import hashlib
+import metrics
+from pipeline import iter_pipeline, iter_zip, pipeline_config, PipelineError, ERROR_ENTRY
+from result_cache import get_result_cache, file_digest, is_valid_key, make_key as make_result_key
+from jobs import JobManager, QueueFullError, SUCCEEDED, FINISHED_STATES
+from generate_content import iter_generate_post, load_style
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS
 
-# Define folder paths
-UPLOAD_FOLDER = 'uploads'
+# Define folder paths. Each upload is processed in its own temporary
+# workspace (under WORKSPACE_ROOT, or the system temp dir), so concurrent
+# requests never touch each other's files.
 OUTPUT_FOLDER = 'output'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+WORKSPACE_ROOT = os.getenv('WORKSPACE_ROOT') or None
+if WORKSPACE_ROOT:
+    os.makedirs(WORKSPACE_ROOT, exist_ok=True)
 
-# Path to your chunking script
-CHUNK_SCRIPT_PATH = r'C:\Users\akenn\OneDrive\Desktop\Coding\apps\personal_content_machine\my-app\server\chunk_transcript.py'
+# Keep a copy of every result ZIP in OUTPUT_FOLDER for debugging
+SAVE_DEBUG_ZIP = os.getenv('SAVE_DEBUG_ZIP', '0') == '1'
+if SAVE_DEBUG_ZIP:
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-def clear_folder(folder):
-    """Remove all files inside the given folder."""
-    for filename in os.listdir(folder):
-        file_path = os.path.join(folder, filename)
-        try:
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-        except Exception as e:
-            print(f'Failed to delete {file_path}. Reason: {e}')
+# Load the embedding model when the worker starts instead of on the first upload
+if os.getenv('WARM_MODEL_ON_STARTUP', '1') == '1':
+    try:
+        chunking_service.warm_up()
+    except Exception as e:
+        print(f"Model warm-up failed, it will be loaded on first use: {e}")
+
+job_manager = JobManager()
+
+# Writing style used by /generate/stream when the request doesn't send one;
+# defaults to the style sheet shipped with the client
+STYLE_FILE = os.getenv('STYLE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                  '..', 'client', 'public', 'jesse-itzler.txt'))
+if not load_style(STYLE_FILE):
+    print(f"Warning: no writing style at STYLE_FILE '{STYLE_FILE}'; "
+          f"/generate/stream will return 503 unless requests send a style.")
+
+def send_cached_result(key, f, etag):
+    """
+    Send a stored archive with its strong ETag. GET requests carrying a
+    matching If-None-Match get a 304 instead of the body.
+    """
+    response = send_file(f, mimetype='application/zip', as_attachment=True,
+                         download_name='filtered_chunks.zip', etag=etag, conditional=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Content-Location'] = f"/results/{key}"
+    return response
+
+@app.before_request
+def start_request_metrics():
+    # Requests sent with "X-Trace: 1" or "?trace=1" are traced stage by stage
+    g.trace = None
+    if request.headers.get('X-Trace') == '1' or request.args.get('trace') == '1':
+        g.trace = metrics.start_trace(f"{request.method} {request.path}")
+    metrics.set_trace(g.trace)
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.HTTP_SECONDS.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    if g.trace is not None:
+        g.trace.add('http', g.request_started, elapsed, status=response.status_code)
+        response.headers['X-Trace-Id'] = g.trace.id
+    return response
+
+@app.teardown_request
+def clear_trace(error=None):
+    metrics.set_trace(None)
 
 @app.route('/')
 def home():
     return 'Hello, World!'
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage timings, LLM latency and token counts, retries and cache hits in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """The spans recorded for a traced request (see the X-Trace-Id response header)."""
+    trace = metrics.get_trace(trace_id)
+    if trace is None:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(trace.to_dict())
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     print("Received upload request")
@@ -50,115 +114,272 @@ def upload_file():
         print("No selected file")
         return jsonify({"error": "No selected file"}), 400
 
-    # Clear previous files
-    clear_folder(UPLOAD_FOLDER)
-    clear_folder(OUTPUT_FOLDER)
+    # Re-uploads of a document the client names are re-chunked incrementally
+    document_id = chunking_service.resolve_document_id(request.form.get('documentId'), content_file.filename)
 
+    workspace = tempfile.mkdtemp(prefix='upload-', dir=WORKSPACE_ROOT)
     try:
-        # Save the uploaded content file with a timestamp to avoid overwriting
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        content_filename = f"{timestamp}_{content_file.filename.replace(' ', '_')}"
-        content_file_path = os.path.join(UPLOAD_FOLDER, content_filename)
+        # Save the uploaded content file inside this request's workspace
+        content_filename = content_file.filename.replace(' ', '_')
+        content_file_path = os.path.join(workspace, os.path.basename(content_filename))
         content_file.save(content_file_path)
         print(f"Content file saved at: {content_file_path}")
 
-        # Run the chunking script
-        command = [
-            'python', os.path.abspath(CHUNK_SCRIPT_PATH),
-            '--file', os.path.abspath(content_file_path),
-            '--method', 'semantic'
-        ]
-
-        print("Running command:", " ".join(command))
-
-        result = subprocess.run(command, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            print(f"Chunking script error: {result.stderr}")
-            return jsonify({"error": "Error in chunking process", "details": result.stderr}), 500
-
-        print("Chunking completed successfully. Output:\n", result.stdout)
-
-        # Parse the script output into chunks
-        chunk_lines = result.stdout.strip().split("\n")
-        chunks = []
-        current_chunk = []
-
-        for line in chunk_lines:
-            if line.startswith("[CHUNK"):
-                if current_chunk:
-                    chunks.append(" ".join(current_chunk))
-                    current_chunk = []
-            else:
-                current_chunk.append(line.strip())
-
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-
-        print(f"Total chunks created: {len(chunks)}")
-
-        if not chunks:
-            print("No chunks were generated.")
-            return jsonify({"error": "No content generated from the transcript"}), 500
-
-        # Apply the filtering logic to remove irrelevant chunks
-        filtered_chunks = filter_chunks(chunks)
-        print(f"Total filtered chunks: {len(filtered_chunks)}")
-
-        if not filtered_chunks:
-            return jsonify({"error": "No meaningful content found after filtering."}), 400
+        # An identical upload under the same configuration was already processed
+        result_cache = get_result_cache()
+        result_key = None
+        if result_cache is not None:
+            result_key = make_result_key(file_digest(content_file_path), pipeline_config())
+            cached = result_cache.open(result_key)
+            if cached is not None:
+                shutil.rmtree(workspace, ignore_errors=True)
+                print(f"Result cache hit: {result_key}")
+                return send_cached_result(result_key, cached[0], cached[1])
+
+        # Run the pipeline up to the first accepted chunk, so errors before any
+        # output can still be reported as a normal JSON error response
+        accepted = iter_pipeline(content_file_path, document_id=document_id)
+        first_chunk = next(accepted)
+    except PipelineError as e:
+        shutil.rmtree(workspace, ignore_errors=True)
+        body = {"error": e.message}
+        if e.details:
+            body["details"] = e.details
+        return jsonify(body), e.status
+    except Exception as e:
+        shutil.rmtree(workspace, ignore_errors=True)
+        print(f"Error processing chunking: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
-        # Save filtered chunks as .txt files and create a ZIP archive
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for idx, chunk in enumerate(filtered_chunks):
-                chunk_filename = f"filtered_chunk_{idx + 1}.txt"
-                chunk_content = chunk.encode('utf-8')
-                print(f"Adding to ZIP: {chunk_filename} - Content Length: {len(chunk_content)}")
-                zip_file.writestr(chunk_filename, chunk_content)
+    # Stream the ZIP to the client entry by entry while later chunks are
+    # still being chunked and scored. The 200 status is sent with the first
+    # entry, so a pipeline error after that is reported in-band: the archive
+    # ends with an ERROR_ENTRY (error.json) after the chunks accepted so far.
+    # Such an archive is neither cached nor kept as a debug copy.
+    debug_path = None
+    if SAVE_DEBUG_ZIP:
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        debug_path = os.path.join(OUTPUT_FOLDER, f"debug_filtered_chunks_{timestamp}_{uuid.uuid4().hex[:8]}.zip")
+
+    trace = g.trace
+
+    def generate():
+        size = 0
+        completed = False
+        debug_file = open(debug_path, 'wb') if debug_path else None
+        # Tee the archive into the result cache, storing it once it is complete
+        cache_path = result_cache.temp_path() if result_key else None
+        cache_file = open(cache_path, 'wb') if cache_path else None
+        digest = hashlib.sha256()
+        # The body is streamed after the request hooks have run, so re-enter the trace
+        previous_trace = metrics.set_trace(trace)
+        try:
+            for part in iter_zip(chain([first_chunk], accepted), report_errors=True):
+                if debug_file:
+                    debug_file.write(part)
+                if cache_file:
+                    cache_file.write(part)
+                    digest.update(part)
+                size += len(part)
+                yield part
+            completed = True
+        except PipelineError as e:
+            print(f"Error while streaming ZIP, closed it with {ERROR_ENTRY}: {e.message}")
+        except Exception as e:
+            # Headers are already sent; all we can do is cut the stream short
+            print(f"Error while streaming ZIP, aborting response: {e}")
+            raise
+        finally:
+            accepted.close()
+            if debug_file:
+                debug_file.close()
+                if completed:
+                    print(f"ZIP file saved locally at: {debug_path}")
+                else:
+                    os.remove(debug_path)
+            if cache_file:
+                cache_file.close()
+                if completed:
+                    result_cache.put(result_key, cache_path, etag=digest.hexdigest())
+                else:
+                    os.remove(cache_path)
+            # Remove this request's workspace, uploaded file included
+            shutil.rmtree(workspace, ignore_errors=True)
+            metrics.set_trace(previous_trace)
+        print(f"Sent ZIP file of size: {size} bytes to client")
+
+    response = Response(generate(), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=filtered_chunks.zip'
+    # The ETag is only known once the archive is complete; later requests
+    # for the same upload get it, and can revalidate at Content-Location
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if result_key:
+        response.headers['Content-Location'] = f"/results/{result_key}"
+    return response
+
+@app.route('/results/<key>', methods=['GET'])
+def get_result(key):
+    """A stored pipeline archive by cache key, with ETag revalidation (304)."""
+    result_cache = get_result_cache()
+    if result_cache is None or not is_valid_key(key):
+        return jsonify({"error": "Result not found"}), 404
+    cached = result_cache.open(key)
+    if cached is None:
+        return jsonify({"error": "Result not found"}), 404
+    return send_cached_result(key, cached[0], cached[1])
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    """
+    Generate a LinkedIn post for one chunk and stream it as Server-Sent Events.
+
+    Takes JSON {"chunk": "...", "style": "..."} ("style" defaults to the
+    contents of STYLE_FILE; 503 if that is missing). Each `delta` event carries {"text": ...} as soon
+    as the model produces it, then a `done` event ends the stream. Errors
+    before the first token are returned as JSON; later ones as an `error`
+    event. If the client disconnects, the upstream stream is closed so no
+    more tokens are generated.
+    """
+    data = request.get_json(silent=True) or {}
+    chunk = data.get('chunk')
+    if not chunk:
+        return jsonify({"error": "Chunk text is required"}), 400
+
+    style_content = data.get('style') or load_style(STYLE_FILE)
+    if not style_content:
+        # A server configuration problem, logged at startup
+        return jsonify({"error": "No writing style configured on the server",
+                        "details": f"STYLE_FILE '{STYLE_FILE}' could not be read"}), 503
+
+    # Wait for the first token before sending headers, as /upload does
+    deltas = iter_generate_post(style_content, chunk)
+    try:
+        first_delta = next(deltas, '')
+    except Exception as e:
+        print(f"Error generating content: {e}")
+        return jsonify({"error": "Failed to generate content", "details": str(e)}), 502
 
-        # Save the ZIP file locally for debugging
-        zip_file_path = os.path.join(OUTPUT_FOLDER, 'debug_filtered_chunks.zip')
-        with open(zip_file_path, 'wb') as f:
-            f.write(zip_buffer.getvalue())
-        
-        print(f"ZIP file saved locally at: {zip_file_path}")
-        print(f"Local ZIP file size: {os.path.getsize(zip_file_path)} bytes")
+    def stream():
+        try:
+            for text in chain([first_delta], deltas):
+                if text:
+                    yield f"event: delta\ndata: {json.dumps({'text': text})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Error while streaming post: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Runs on client disconnect too, closing the Anthropic stream
+            deltas.close()
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue an uploaded transcript for background processing and return its job ID."""
+    if 'contentFile' not in request.files:
+        return jsonify({"error": "Content file is required"}), 400
 
-        zip_buffer.seek(0)
+    content_file = request.files['contentFile']
+    if content_file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
 
-        # Check the ZIP file size
-        zip_size = len(zip_buffer.getvalue())
-        print(f"ZIP file size in memory: {zip_size} bytes")
+    # Unique name so queued jobs never overwrite each other's input; the
+    # client's filename is only kept as job metadata
+    content_file_path = job_manager.input_path()
+    content_file.save(content_file_path)
 
-        # Cleanup uploaded files
+    document_id = chunking_service.resolve_document_id(request.form.get('documentId'), content_file.filename)
+    try:
+        job = job_manager.submit(content_file_path, document_id=document_id, filename=content_file.filename)
+    except QueueFullError as e:
         os.remove(content_file_path)
-        print(f"Deleted uploaded file: {content_file_path}")
-
-        print("Filtered chunks saved and zipped successfully")
-
-        response = send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='filtered_chunks.zip'
-        )
-
-        # Additional headers to ensure proper download handling
-        response.headers['Content-Length'] = str(len(zip_buffer.getvalue()))
-        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-
-        print(f"Sending ZIP file of size: {len(zip_buffer.getvalue())} bytes to client")
-
-        return response
-
-    except Exception as e:
-        print(f"Error processing chunking: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+        response = jsonify({"error": "Too many jobs in progress, try again later", "details": str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 429
+
+    print(f"Queued job {job.id} for {content_file_path}")
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+        "result_url": f"/jobs/{job.id}/result"
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-Sent Events stream of a job's progress. Each event's data is a JSON
+    object with at least `stage` and `status`; the stream ends once the job
+    finishes. Reconnecting clients resume from Last-Event-ID and get the
+    latest event of each stage they haven't seen.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
 
+    try:
+        start = int(request.headers.get('Last-Event-ID', '-1')) + 1
+    except ValueError:
+        start = 0
+
+    def stream():
+        position = start
+        while True:
+            events, finished = job.wait_for_events(position)
+            for event_id, event in events:
+                yield f"id: {event_id}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+                position = event_id + 1
+            if finished and not events:
+                return
+            if not events:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status != SUCCEEDED:
+        status = 410 if job.status in FINISHED_STATES else 409
+        return jsonify({"error": f"Job is {job.status}", "job": job.to_dict()}), status
+
+    return send_file(
+        os.path.abspath(job.result_path),
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name='filtered_chunks.zip'
+    )
+
+# Uploads share no per-request state on disk, so the app can run multi-worker,
+# e.g. `gunicorn -w 4 --threads 4 app:app` or `waitress-serve --threads 8 app:app`.
+# The /jobs API keeps job state in memory, so it needs a single worker process
+# (threads are fine) or sticky routing by job ID.
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000, threaded=True)
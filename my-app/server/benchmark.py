@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the upload pipeline.
+
+Generates synthetic speaker-line transcripts (1k to 500k utterances), then
+times each stage (parsing, Q&A and semantic chunking, LLM filtering, ZIP
+packaging, post generation) and the end-to-end /upload request, with Q&A
+chunking ('upload') and with semantic chunking ('upload-semantic', which
+needs the embedding model). The OpenAI
+and Anthropic APIs are replaced by local stub servers with configurable
+latency and error rates, so runs are repeatable and cost nothing.
+
+Every (stage, size) case runs in a fresh process, so its peak RSS is its own.
+Verdict, embedding and result caches and the client-side OpenAI rate limits
+are disabled unless set in the environment, so every run measures the cold
+path.
+
+    python benchmark.py run --sizes 1000 10000 --stages parse qa filter zip upload
+    python benchmark.py compare benchmarks/results-A.json benchmarks/results-B.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import get_context
+
+BENCHMARK_DIR = os.getenv('BENCHMARK_DIR', 'benchmarks')
+
+STAGES = ('parse', 'qa', 'semantic', 'filter', 'zip', 'generate', 'upload', 'upload-semantic')
+DEFAULT_STAGES = ('parse', 'qa', 'filter', 'zip', 'generate', 'upload')
+
+TARGET_LABEL = 'Austin Kennedy'
+INTERVIEWER_LABEL = 'Speaker A'
+
+# ---------------------------------------------------------------------------
+# Synthetic transcripts
+# ---------------------------------------------------------------------------
+
+_SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'to', 'sa', 'vi', 'der', 'an', 'po', 'lu', 'ne', 'gra', 'ti', 'mon', 'es']
+_FUNCTION_WORDS = ['the', 'and', 'of', 'to', 'a', 'in', 'that', 'we', 'it', 'is', 'was', 'for', 'you', 'so']
+
+def make_transcript(path, utterances, seed=0, topics=50, topic_length=40):
+    """
+    Write a transcript of `utterances` utterances to `path` in the no-colon
+    format: a speaker line, then the utterance text wrapped over lines.
+
+    Interviewer questions alternate with longer answers from the target
+    speaker. Answers draw most words from a topic vocabulary that changes
+    every ~`topic_length` utterances, so semantic chunking has real
+    boundaries to find. The same (utterances, seed) always gives the same file.
+    """
+    rng = random.Random(seed)
+    vocabularies = [
+        [''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(200)]
+        for _ in range(topics)
+    ]
+    topic = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(utterances):
+            if rng.random() < 1 / topic_length:
+                topic = rng.randrange(topics)
+            vocabulary = vocabularies[topic]
+            if i % 2 == 0:
+                speaker, length = INTERVIEWER_LABEL, rng.randint(5, 20)
+            else:
+                speaker, length = TARGET_LABEL, int(rng.lognormvariate(3.8, 0.6))
+            words = [rng.choice(vocabulary) if rng.random() < 0.6 else rng.choice(_FUNCTION_WORDS)
+                     for _ in range(max(length, 1))]
+            if rng.random() < 0.1:
+                words.insert(rng.randrange(len(words)), f"{rng.randint(2, 99)}%")
+            f.write(f"{speaker}\n")
+            for start in range(0, len(words), 15):
+                f.write(" ".join(words[start:start + 15]) + "\n")
+            f.write("\n")
+    return path
+
+def transcript_path(utterances, seed=0, directory=BENCHMARK_DIR):
+    """Path of the synthetic transcript for (utterances, seed), generated on first use."""
+    path = os.path.join(directory, 'transcripts', f"transcript-{utterances}-{seed}.txt")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        make_transcript(tmp_path, utterances, seed=seed)
+        os.replace(tmp_path, path)
+    return path
+
+# ---------------------------------------------------------------------------
+# Stub LLM servers
+# ---------------------------------------------------------------------------
+
+def _stub_scores(text):
+    """Deterministic scores for a chunk; roughly a third of chunks pass."""
+    value = 1 + zlib.crc32(text.encode('utf-8')) % 5
+    return {"substance": value, "statistics": 1, "storytelling": 1, "clarity": min(value, 3)}
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        stub.wait()
+        if stub.should_fail():
+            status, error = stub.error_response()
+            self._send_json(status, error)
+        elif self.path.endswith('/chat/completions'):
+            self._send_json(200, stub.openai_response(body))
+        elif self.path.endswith('/messages'):
+            self._send_json(200, stub.anthropic_response(body))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+class StubLLMServer:
+    """
+    Local stand-in for the OpenAI chat-completions or Anthropic messages API.
+
+    Parameters:
+      - provider: 'openai' or 'anthropic' (decides the error format)
+      - latency: mean seconds per request; each request waits 0.5x-1.5x of it
+      - error_rate: share of requests answered with a retryable error
+        (429 for OpenAI, 529 overloaded for Anthropic)
+    """
+    def __init__(self, provider, latency=0.0, error_rate=0.0, seed=0):
+        self.provider = provider
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self):
+        with self.lock:
+            counts = {'requests': self.requests, 'errors': self.errors}
+            self.requests = self.errors = 0
+        return counts
+
+    def wait(self):
+        if self.latency:
+            with self.lock:
+                delay = self.latency * self.rng.uniform(0.5, 1.5)
+            time.sleep(delay)
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            failed = self.rng.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def error_response(self):
+        if self.provider == 'anthropic':
+            return 529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}
+        return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+
+    def openai_response(self, body):
+        prompt = body['messages'][-1]['content']
+        # The chunk text sits between the first two "---" lines; batch
+        # prompts number their chunks there as "[1]\n<text>"
+        sections = prompt.split('\n---\n')
+        text = sections[1] if len(sections) > 2 else prompt
+        parts = re.split(r'(?:^|\n\n)\[(\d+)\]\n', text)
+        if len(parts) > 1:
+            answer = {"scores": [dict(id=int(parts[k]), **_stub_scores(parts[k + 1]))
+                                 for k in range(1, len(parts), 2)]}
+        else:
+            answer = _stub_scores(text)
+        content = json.dumps(answer)
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get('model', 'stub'),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4}
+        }
+
+    def anthropic_response(self, body):
+        prompt = body['messages'][-1]['content']
+        prompt = prompt if isinstance(prompt, str) else json.dumps(prompt)
+        text = "Benchmark post. " * 20
+        return {
+            "id": "msg_bench", "type": "message", "role": "assistant", "model": body.get('model', 'stub'),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+        }
+
+# ---------------------------------------------------------------------------
+# Cases (each runs in its own process)
+# ---------------------------------------------------------------------------
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _prepare(stage, path, max_llm_chunks):
+    """Build the untimed input of `stage`; returns (run, unit)."""
+    from chunk_transcript import parse_transcript_no_colon, chunk_by_qa, chunk_by_semantic
+
+    speakers = {TARGET_LABEL.lower(), INTERVIEWER_LABEL.lower()}
+    if stage == 'parse':
+        return (lambda: len(parse_transcript_no_colon(path, speakers))), 'utterances'
+    if stage in ('upload', 'upload-semantic'):
+        if stage == 'upload-semantic':
+            # Read by chunking_service when the app is imported below
+            os.environ['CHUNK_METHOD'] = 'semantic'
+        import app as flask_app
+        client = flask_app.app.test_client()
+        data = parse_transcript_no_colon(path, speakers)
+
+        def upload():
+            with open(path, 'rb') as f:
+                response = client.post('/upload', data={'contentFile': (f, os.path.basename(path))},
+                                       content_type='multipart/form-data')
+            if response.status_code != 200:
+                raise RuntimeError(f"/upload returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            response.get_data()
+            return len(data)
+        return upload, 'utterances'
+
+    data = parse_transcript_no_colon(path, speakers)
+    target, interviewer = TARGET_LABEL.lower(), INTERVIEWER_LABEL.lower()
+    if stage == 'qa':
+        return (lambda: len(data) if chunk_by_qa(data, target, interviewer) is not None else 0), 'utterances'
+    if stage == 'semantic':
+        return (lambda: len(data) if chunk_by_semantic(data, target) is not None else 0), 'utterances'
+
+    chunks = chunk_by_qa(data, target, interviewer)
+    if stage == 'zip':
+        from pipeline import iter_zip
+
+        def package():
+            for _ in iter_zip(chunks):
+                pass
+            return len(chunks)
+        return package, 'chunks'
+
+    chunks = chunks[:max_llm_chunks] if max_llm_chunks else chunks
+    if stage == 'filter':
+        from filter_chunks import filter_chunks
+        return (lambda: len(chunks) if filter_chunks(chunks) is not None else 0), 'chunks'
+    if stage == 'generate':
+        from generate_content import generate_posts
+        style = "Write short, direct posts in the first person."
+
+        def generate():
+            results = generate_posts(chunks, style_content=style)
+            failed = sum(1 for r in results if r['error'])
+            if failed:
+                raise RuntimeError(f"{failed} of {len(chunks)} post(s) failed")
+            return len(chunks)
+        return generate, 'chunks'
+    raise ValueError(f"Unknown stage: {stage}")
+
+def run_case(stage, path, repeat, warmup, max_llm_chunks):
+    """
+    Time `stage` on the transcript at `path`: `warmup` untimed runs, then
+    `repeat` timed ones. Returns durations, items processed and peak RSS.
+    Pipeline logging goes to /dev/null so it doesn't drown the report.
+    """
+    import contextlib
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            run, unit = _prepare(stage, path, max_llm_chunks)
+            for _ in range(warmup):
+                run()
+            durations = []
+            items = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                items = run()
+                durations.append(time.perf_counter() - start)
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}", 'peak_rss_mb': _peak_rss_mb()}
+    return {'durations': durations, 'items': items, 'unit': unit, 'peak_rss_mb': _peak_rss_mb()}
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def percentile(values, q):
+    """Linearly interpolated percentile (q in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def summarize(durations, items):
+    p50 = percentile(durations, 50)
+    return {
+        'p50_s': p50,
+        'p95_s': percentile(durations, 95),
+        'throughput': items / p50 if p50 > 0 else None
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _print_row(result):
+    label = f"{result['stage']:<15} {result['utterances']:>8}"
+    if 'error' in result:
+        print(f"{label}  FAILED: {result['error']}")
+        return
+    llm = result.get('llm') or {}
+    llm_text = f"  llm {llm['requests']} req/{llm['errors']} err" if llm.get('requests') else ""
+    print(f"{label}  p50 {result['p50_s']:8.3f}s  p95 {result['p95_s']:8.3f}s  "
+          f"{result['throughput']:10.0f} {result['unit']}/s  peak RSS {result['peak_rss_mb']:7.1f} MB{llm_text}")
+
+def run(args):
+    stubs = {
+        'openai': StubLLMServer('openai', args.openai_latency, args.openai_error_rate, seed=args.seed).start(),
+        'anthropic': StubLLMServer('anthropic', args.anthropic_latency, args.anthropic_error_rate,
+                                   seed=args.seed).start()
+    }
+    # Children inherit this environment; explicit settings in the caller's environment win
+    defaults = {
+        'OPENAI_BASE_URL': f"{stubs['openai'].url}/v1",
+        'OPENAI_API_KEY': 'benchmark',
+        'ANTHROPIC_BASE_URL': stubs['anthropic'].url,
+        'ANTHROPIC_API_KEY': 'benchmark',
+        'VERDICT_CACHE_PATH': '',
+        'VERDICT_LOG_PATH': '',
+        'PREFILTER_MODEL_PATH': '',
+        'EMBEDDING_CACHE_DIR': '',
+        'INCREMENTAL_STATE_DIR': '',
+        'RESULT_CACHE_DIR': '',
+        # Measure the pipeline, not the client-side rate limiter
+        'OPENAI_REQUESTS_PER_MINUTE': '0',
+        'OPENAI_TOKENS_PER_MINUTE': '0',
+        'WARM_MODEL_ON_STARTUP': '0',
+        'CHUNK_METHOD': 'qa',
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+    results = []
+    try:
+        for utterances in args.sizes:
+            path = transcript_path(utterances, seed=args.seed)
+            for stage in args.stages:
+                for stub in stubs.values():
+                    stub.reset()
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                    outcome = pool.submit(run_case, stage, path, args.repeat, args.warmup,
+                                          args.max_llm_chunks).result()
+                result = {'stage': stage, 'utterances': utterances, 'peak_rss_mb': outcome['peak_rss_mb']}
+                if 'error' in outcome:
+                    result['error'] = outcome['error']
+                else:
+                    result.update(summarize(outcome['durations'], outcome['items']))
+                    result.update(durations_s=outcome['durations'], items=outcome['items'], unit=outcome['unit'])
+                provider = {'filter': 'openai', 'upload': 'openai', 'upload-semantic': 'openai',
+                            'generate': 'anthropic'}.get(stage)
+                if provider:
+                    result['llm'] = stubs[provider].reset()
+                results.append(result)
+                _print_row(result)
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('func', 'out')},
+        'results': results
+    }
+    out = args.out or os.path.join(BENCHMARK_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to '{out}'.")
+
+def compare(args):
+    """Print the change in p50, p95 and peak RSS per case; exit 1 on a regression."""
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    before = {(r['stage'], r['utterances']): r for r in baseline['results'] if 'error' not in r}
+    print(f"Baseline {baseline.get('commit')} ({baseline['created_at']}) -> "
+          f"candidate {candidate.get('commit')} ({candidate['created_at']})")
+    differing = sorted(key for key in set(baseline['settings']) | set(candidate['settings'])
+                       if key not in ('sizes', 'stages')
+                       and baseline['settings'].get(key) != candidate['settings'].get(key))
+    if differing:
+        print(f"Note: the runs used different settings ({', '.join(differing)}); changes may not be comparable.")
+    regressions = 0
+    for result in candidate['results']:
+        old = before.get((result['stage'], result['utterances']))
+        if old is None or 'error' in result:
+            continue
+        changes = []
+        for metric in ('p50_s', 'p95_s', 'peak_rss_mb'):
+            change = (result[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            flag = ''
+            if change > args.tolerance and metric != 'p95_s':
+                regressions += 1
+                flag = ' !'
+            changes.append(f"{metric} {old[metric]:.3f} -> {result[metric]:.3f} ({change:+.1%}){flag}")
+        print(f"{result['stage']:<15} {result['utterances']:>8}  " + "  ".join(changes))
+    if regressions:
+        print(f"{regressions} regression(s) beyond {args.tolerance:.0%}.")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the upload pipeline on synthetic transcripts.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmarks and save the results.")
+    run_parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 10000, 100000],
+                            help="Transcript lengths in utterances (1k to 500k).")
+    run_parser.add_argument("--stages", nargs='+', choices=STAGES, default=list(DEFAULT_STAGES))
+    run_parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case.")
+    run_parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per case.")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--max_llm_chunks", type=int, default=1000,
+                            help="Cap on chunks sent to the filter and generate stages (0 = all).")
+    run_parser.add_argument("--openai_latency", type=float, default=0.05, help="Mean stub latency in seconds.")
+    run_parser.add_argument("--openai_error_rate", type=float, default=0.0)
+    run_parser.add_argument("--anthropic_latency", type=float, default=0.2, help="Mean stub latency in seconds.")
+    run_parser.add_argument("--anthropic_error_rate", type=float, default=0.0)
+    run_parser.add_argument("--out", type=str, default=None,
+                            help="Results file (default: benchmarks/results-<timestamp>.json).")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help="Compare two saved runs.")
+    compare_parser.add_argument("baseline", type=str)
+    compare_parser.add_argument("candidate", type=str)
+    compare_parser.add_argument("--tolerance", type=float, default=0.1,
+                                help="Relative slowdown or memory growth reported as a regression.")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
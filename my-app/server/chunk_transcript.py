@@ -1,18 +1,63 @@
 #!/usr/bin/env python3
 
 import argparse
+import bisect
+import glob
+import json
 import sys
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+import metrics
+from token_count import count_tokens_many
+from embedding_backends import load_model, model_id, EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE
 
 # For semantic chunking
 try:
-    from sentence_transformers import SentenceTransformer, util
+    import numpy as np
+    import sentence_transformers
     _HAS_SENTENCE_TRANSFORMERS = True
 except ImportError:
     _HAS_SENTENCE_TRANSFORMERS = False
     print("Note: 'sentence-transformers' is not installed. Semantic chunking will not work.")
 
-def parse_transcript_no_colon(file_path, speakers_of_interest):
+DEFAULT_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+class ChunkingCancelled(Exception):
+    """Raised when streaming chunking is stopped through its cancel event."""
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ChunkingCancelled()
+
+# Loaded models, keyed by (model name, backend). Shared by every caller in this
+# process so the (slow) model load only happens once per worker.
+_MODELS = {}
+_MODEL_LOCK = threading.Lock()
+
+def get_model(model_name=DEFAULT_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    """
+    Return an encoder for `model_name` on `backend` (see embedding_backends.py),
+    loading it on first use. Subsequent calls (from any thread) reuse the same
+    instance.
+    """
+    if backend == 'torch' and not _HAS_SENTENCE_TRANSFORMERS:
+        raise RuntimeError("'sentence-transformers' not installed. Cannot do semantic chunking.")
+
+    key = (model_name, backend)
+    model = _MODELS.get(key)
+    if model is None:
+        with _MODEL_LOCK:
+            model = _MODELS.get(key)
+            if model is None:
+                model = load_model(model_name, backend)
+                _MODELS[key] = model
+    return model
+
+def iter_transcript_spans(file_path, speakers_of_interest):
     """
     Parse a transcript where each speaker has their own line (e.g., "Austin Kennedy")
     followed by one or more lines of text, until the next speaker line appears.
@@ -21,17 +66,19 @@ def parse_transcript_no_colon(file_path, speakers_of_interest):
       - file_path: path to the .txt transcript
       - speakers_of_interest: list of possible speaker labels (in lower-case)
 
-    Returns:
-      A list of (speaker, text) tuples, where `speaker` is exactly the line read
-      from the file, and `text` is the accumulated text until the next speaker line.
+    Yields:
+      (speaker, text, first_line, last_line) tuples as soon as each utterance is
+      complete, where `speaker` is exactly the line read from the file, `text` is
+      the accumulated text until the next speaker line, and the line numbers
+      (1-based) locate that text in the file.
     """
 
-    transcript_data = []
     current_speaker = None
     current_text = []
+    first_line = last_line = None
 
     with open(file_path, 'r', encoding='utf-8-sig') as f:
-        for raw_line in f:
+        for line_number, raw_line in enumerate(f, start=1):
             line = raw_line.strip()
             if not line:
                 # Skip empty lines
@@ -41,27 +88,80 @@ def parse_transcript_no_colon(file_path, speakers_of_interest):
             if line.lower() in speakers_of_interest:
                 # We have encountered a new speaker
                 if current_speaker is not None and current_text:
-                    # Store the previous speaker's text
-                    transcript_data.append((current_speaker, " ".join(current_text)))
+                    # Emit the previous speaker's text
+                    yield (current_speaker, " ".join(current_text), first_line, last_line)
                     current_text = []
                 current_speaker = line  # keep the exact capitalization
             else:
                 # This line is text for the current speaker
+                if not current_text:
+                    first_line = line_number
+                last_line = line_number
                 current_text.append(line)
 
-    # After the loop, if there's any leftover text, append it
+    # After the loop, if there's any leftover text, emit it
     if current_speaker is not None and current_text:
-        transcript_data.append((current_speaker, " ".join(current_text)))
+        yield (current_speaker, " ".join(current_text), first_line, last_line)
 
-    return transcript_data
+class SpeakerIndex:
+    """
+    Interns speaker labels (case-insensitive) to small integer IDs, so a
+    speaker line is resolved with one dict lookup while parsing and the
+    chunkers compare integers instead of matching substrings.
+    """
+    def __init__(self, labels=()):
+        self.ids = {}
+        self.labels = []
+        for label in labels:
+            self.intern(label)
 
-def chunk_by_qa(transcript_data, target_label="austin kennedy", interviewer_label="speaker a"):
+    def intern(self, label):
+        key = label.lower()
+        if key not in self.ids:
+            self.ids[key] = len(self.labels)
+            self.labels.append(key)
+        return self.ids[key]
+
+    def id_of(self, label):
+        return self.ids.get(label.lower())
+
+def iter_transcript_ids(file_path, speaker_index):
+    """
+    Parse a transcript in the no-colon format for the speakers in
+    `speaker_index` (a SpeakerIndex).
+
+    Yields:
+      (speaker_id, text) tuples as soon as each utterance is complete.
+    """
+    for speaker, text, _, _ in iter_transcript_spans(file_path, speaker_index.ids):
+        yield (speaker_index.ids[speaker.lower()], text)
+
+def iter_transcript_no_colon(file_path, speakers_of_interest):
+    """
+    Parse a transcript in the no-colon format (see iter_transcript_spans).
+
+    Yields:
+      (speaker, text) tuples as soon as each utterance is complete.
+    """
+    for speaker, text, _, _ in iter_transcript_spans(file_path, speakers_of_interest):
+        yield (speaker, text)
+
+def parse_transcript_no_colon(file_path, speakers_of_interest):
+    """
+    List version of iter_transcript_no_colon.
+
+    Returns:
+      A list of (speaker, text) tuples.
+    """
+    return list(iter_transcript_no_colon(file_path, speakers_of_interest))
+
+def iter_chunks_by_qa(transcript_data, target_label="austin kennedy", interviewer_label="speaker a"):
     """
     Simple Q&A chunking for Austin Kennedy:
       - Each time the Interviewer speaks, we consider that the end of Austin Kennedy's current chunk.
-      - Returns a list of text chunks (strings) for Austin Kennedy.
+      - Yields text chunks (strings) for Austin Kennedy as soon as each one ends.
+    `transcript_data` can be any iterable of (speaker, text), including a parser generator.
     """
-    chunks = []
     current_chunk = []
 
     for (speaker, text) in transcript_data:
@@ -70,7 +170,7 @@ def chunk_by_qa(transcript_data, target_label="austin kennedy", interviewer_labe
         if interviewer_label in spk_lower:
             # Interviewer just started speaking => end the current Austin chunk
             if current_chunk:
-                chunks.append(" ".join(current_chunk))
+                yield " ".join(current_chunk)
                 current_chunk = []
         elif target_label in spk_lower:
             # This is Austin Kennedy => accumulate his text
@@ -78,87 +178,717 @@ def chunk_by_qa(transcript_data, target_label="austin kennedy", interviewer_labe
 
     # If there's any leftover Austin Kennedy text
     if current_chunk:
-        chunks.append(" ".join(current_chunk))
+        yield " ".join(current_chunk)
 
-    return chunks
+def chunk_by_qa(transcript_data, target_label="austin kennedy", interviewer_label="speaker a"):
+    """
+    Simple Q&A chunking for Austin Kennedy (list version of iter_chunks_by_qa).
+      - Returns a list of text chunks (strings) for Austin Kennedy.
+    """
+    return list(iter_chunks_by_qa(transcript_data, target_label, interviewer_label))
 
-def chunk_by_semantic(transcript_data, target_label="austin kennedy", threshold=0.6):
+def encode_normalized(model, lines, embedding_cache=None):
+    """
+    Encode `lines` with `model` and return an (n, d) float32 numpy array of
+    unit-length embeddings, so cosine similarity is a plain dot product.
+    With an `embedding_cache` (see embedding_cache.py), only lines not seen
+    before are encoded.
+    """
+    def encode(batch):
+        with metrics.stage('embed'):
+            embeddings = model.encode(batch, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                      normalize_embeddings=True).astype(np.float32, copy=False)
+        metrics.record_items('embed', len(batch))
+        return embeddings
+
+    if embedding_cache is not None:
+        return embedding_cache.encode(lines, encode)
+    return encode(lines)
+
+def adjacent_similarities(embeddings):
+    """
+    Cosine similarity between every pair of consecutive (normalized) embeddings,
+    in one batched operation. Element i compares unit i with unit i+1.
+    """
+    return np.einsum('ij,ij->i', embeddings[:-1], embeddings[1:])
+
+def window_similarities(embeddings, window=3):
+    """
+    TextTiling-style block similarity. For each gap i (between unit i and i+1),
+    compare the mean embedding of the `window` units ending at i with the mean
+    of the `window` units starting at i+1. Blocks are truncated at the edges.
+    """
+    n = len(embeddings)
+    # Prefix sums give every block sum in O(1), so the whole pass is O(n * d).
+    prefix = np.vstack([np.zeros((1, embeddings.shape[1]), dtype=embeddings.dtype),
+                        np.cumsum(embeddings, axis=0)])
+    gaps = np.arange(n - 1)
+    split = gaps + 1
+    left = prefix[split] - prefix[np.maximum(split - window, 0)]
+    right = prefix[np.minimum(split + window, n)] - prefix[split]
+
+    left /= np.linalg.norm(left, axis=1, keepdims=True) + 1e-12
+    right /= np.linalg.norm(right, axis=1, keepdims=True) + 1e-12
+    return np.einsum('ij,ij->i', left, right)
+
+def depth_scores(similarities):
+    """
+    Depth of each gap's similarity below the nearest peak on its left and on
+    its right, found by climbing from the gap while the similarity does not
+    fall (as in TextTiling): (left_peak - s) + (right_peak - s).
+    """
+    n = len(similarities)
+    positions = np.arange(n)
+    # A left climb from gap i stops at the nearest j <= i whose left neighbour
+    # is lower; a right climb at the nearest j >= i whose right neighbour is lower.
+    stops_left = np.concatenate(([True], similarities[:-1] < similarities[1:]))
+    stops_right = np.concatenate((similarities[1:] < similarities[:-1], [True]))
+    left = np.maximum.accumulate(np.where(stops_left, positions, 0))
+    right = np.minimum.accumulate(np.where(stops_right, positions, n - 1)[::-1])[::-1]
+    return (similarities[left] - similarities) + (similarities[right] - similarities)
+
+def tiling_boundaries(similarities, depth_cutoff=None):
+    """
+    Return the gap indices to split at: local minima of `similarities` whose
+    depth score exceeds `depth_cutoff` (default: mean - std / 2 of all depths,
+    as in Hearst's TextTiling).
+    """
+    if len(similarities) == 0:
+        return np.array([], dtype=np.int64)
+
+    depths = depth_scores(similarities)
+    if depth_cutoff is None:
+        depth_cutoff = depths.mean() - depths.std() / 2
+
+    prev = np.concatenate(([np.inf], similarities[:-1]))
+    nxt = np.concatenate((similarities[1:], [np.inf]))
+    is_minimum = (similarities <= prev) & (similarities < nxt)
+    return np.flatnonzero(is_minimum & (depths > depth_cutoff) & (depths > 0))
+
+def _weakest_cuts(counts, similarities, max_tokens):
+    """
+    Gap indices at which to cut one chunk so every piece fits in `max_tokens`.
+    Gaps are tried weakest-similarity first, and a gap is cut only while the
+    piece containing it is still too long, which gives the same result as
+    recursively splitting at each piece's weakest point. A single utterance
+    longer than `max_tokens` stays whole.
+    """
+    prefix = [0] + list(accumulate(counts))
+    if prefix[-1] <= max_tokens:
+        return []
+    cuts = []
+    for gap in sorted(range(len(similarities)), key=lambda i: similarities[i]):
+        pos = bisect.bisect_left(cuts, gap)
+        start = cuts[pos - 1] + 1 if pos else 0
+        end = cuts[pos] + 1 if pos < len(cuts) else len(counts)
+        if prefix[end] - prefix[start] > max_tokens:
+            cuts.insert(pos, gap)
+    return cuts
+
+def size_segments(segments, min_tokens=0, max_tokens=0):
+    """
+    Enforce token bounds on chunks.
+
+    `segments` yields one (items, texts, similarities) tuple per chunk, where
+    `texts[i]` is the text of `items[i]` and `similarities[i]` compares texts
+    i and i+1. Chunks over `max_tokens` are split at their weakest internal
+    similarity; a piece under `min_tokens` is merged into its neighbour while
+    the result stays within `max_tokens`. Yields the item list of each
+    resulting chunk, in order. With both bounds 0 the chunks pass through.
+    """
+    held = None
+    held_tokens = 0
+    for items, texts, similarities in segments:
+        if not min_tokens and not max_tokens:
+            yield list(items)
+            continue
+        counts = count_tokens_many(texts)
+        cuts = _weakest_cuts(counts, similarities, max_tokens) if max_tokens else []
+        starts = [0] + [c + 1 for c in cuts]
+        ends = starts[1:] + [len(items)]
+        for start, end in zip(starts, ends):
+            piece = list(items[start:end])
+            tokens = sum(counts[start:end])
+            if (held is not None and (held_tokens < min_tokens or tokens < min_tokens)
+                    and (not max_tokens or held_tokens + tokens <= max_tokens)):
+                held.extend(piece)
+                held_tokens += tokens
+            else:
+                if held is not None:
+                    yield held
+                held, held_tokens = piece, tokens
+    if held is not None:
+        yield held
+
+def _boundary_segments(lines, similarities, boundaries):
+    """(lines, lines, similarities) per chunk between `boundaries`, for size_segments."""
+    starts = [0] + [int(b) + 1 for b in boundaries]
+    ends = starts[1:] + [len(lines)]
+    for s, e in zip(starts, ends):
+        yield lines[s:e], lines[s:e], similarities[s:e - 1]
+
+def _target_lines(transcript_data, target_label):
+    return [txt for (spk, txt) in transcript_data if target_label in spk.lower()]
+
+def chunk_by_semantic(transcript_data, target_label="austin kennedy", threshold=0.6, model=None,
+                      embedding_cache=None, min_tokens=0, max_tokens=0):
     """
     Semantic chunking using embeddings:
       - Collect only Austin Kennedy lines as separate 'units'.
       - Compute embeddings and compare consecutive lines.
       - Split whenever similarity < threshold.
+      - Keep chunks within `min_tokens`/`max_tokens` (0 = no bound; see size_segments).
+    `model` defaults to the shared instance from get_model(); `embedding_cache`
+    optionally reuses embeddings from earlier runs.
     Returns a list of text chunks for Austin Kennedy.
     """
-    if not _HAS_SENTENCE_TRANSFORMERS:
-        print("Error: 'sentence-transformers' not installed. Cannot do semantic chunking.")
-        sys.exit(1)
+    if model is None:
+        model = get_model()
 
     # Extract only Austin Kennedy lines
-    target_lines = [txt for (spk, txt) in transcript_data if target_label in spk.lower()]
+    target_lines = _target_lines(transcript_data, target_label)
     if not target_lines:
         print("No Austin Kennedy lines found. Check transcript format or speaker label.")
         return []
 
-    # Create embeddings
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    embeddings = model.encode(target_lines, convert_to_tensor=True)
+    # Create embeddings and compare all neighbours at once
+    embeddings = encode_normalized(model, target_lines, embedding_cache=embedding_cache)
+    similarities = adjacent_similarities(embeddings)
+
+    # Big topic shift => start new chunk
+    boundaries = np.flatnonzero(similarities < threshold)
+    segments = _boundary_segments(target_lines, similarities, boundaries)
+    return [" ".join(lines) for lines in size_segments(segments, min_tokens, max_tokens)]
 
-    chunks = []
-    current_chunk = [target_lines[0]]
+def iter_chunks_by_semantic(transcript_data, target_label="austin kennedy", threshold=0.6, model=None,
+                            embedding_cache=None, encode_batch_size=64, min_tokens=0, max_tokens=0,
+                            cancel_event=None):
+    """
+    Streaming version of chunk_by_semantic for pipelined processing.
+
+    Austin Kennedy lines are embedded `encode_batch_size` at a time as they
+    arrive from `transcript_data` (any iterable, e.g. a parser generator), and
+    each chunk is yielded as soon as the boundary after it is found (and, with
+    a `min_tokens` bound, once the next chunk shows whether to merge). Produces
+    the same chunks as chunk_by_semantic. Setting `cancel_event` stops it
+    with ChunkingCancelled before the next batch is embedded.
+    """
+    if model is None:
+        model = get_model()
 
-    for i in range(len(embeddings) - 1):
-        sim = util.cos_sim(embeddings[i], embeddings[i+1]).item()
-        if sim < threshold:
-            # Big topic shift => start new chunk
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [target_lines[i+1]]
+    current_chunk = []
+    current_sims = []  # similarities between consecutive lines of current_chunk
+    previous = None  # embedding of the last line seen, carried across batches
+    pending = []
+    found_any = False
+
+    def flush(lines):
+        nonlocal previous, current_chunk, current_sims
+        _check_cancelled(cancel_event)
+        embeddings = encode_normalized(model, lines, embedding_cache=embedding_cache)
+        if previous is not None:
+            embeddings_with_prev = np.vstack([previous[None, :], embeddings])
         else:
-            # Continue
-            current_chunk.append(target_lines[i+1])
+            embeddings_with_prev = embeddings
+        similarities = adjacent_similarities(embeddings_with_prev)
+        # With a carried embedding, similarity i compares the line before line i
+        # with line i; without one, line 0 has no predecessor.
+        offset = 0 if previous is not None else 1
+        if previous is None:
+            current_chunk.append(lines[0])
+        for i, sim in enumerate(similarities):
+            line = lines[i + offset]
+            if sim < threshold:
+                yield current_chunk, current_chunk, current_sims
+                current_chunk = [line]
+                current_sims = []
+            else:
+                current_chunk.append(line)
+                current_sims.append(float(sim))
+        previous = embeddings[-1]
 
-    # Final chunk
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+    def segments():
+        nonlocal pending, found_any
+        for (spk, txt) in transcript_data:
+            if target_label not in spk.lower():
+                continue
+            found_any = True
+            pending.append(txt)
+            if len(pending) >= encode_batch_size:
+                yield from flush(pending)
+                pending = []
+
+        if pending:
+            yield from flush(pending)
+
+        if not found_any:
+            print("No Austin Kennedy lines found. Check transcript format or speaker label.")
+            return
+
+        # Final chunk
+        if current_chunk:
+            yield current_chunk, current_chunk, current_sims
+
+    for lines in size_segments(segments(), min_tokens, max_tokens):
+        yield " ".join(lines)
+
+def chunk_by_tiling(transcript_data, target_label="austin kennedy", window=3, depth_cutoff=None, model=None,
+                    embedding_cache=None, min_tokens=0, max_tokens=0):
+    """
+    Windowed (TextTiling-style) semantic chunking:
+      - Compare blocks of `window` Austin Kennedy lines on either side of each gap.
+      - Split at similarity minima that are deep relative to the surrounding peaks.
+    A single off-topic line barely moves a block average, so it no longer
+    breaks a topic into pieces the way the pairwise threshold does.
+    Chunks are kept within `min_tokens`/`max_tokens` as in chunk_by_semantic.
+    Returns a list of text chunks for Austin Kennedy.
+    """
+    if model is None:
+        model = get_model()
+
+    target_lines = _target_lines(transcript_data, target_label)
+    if not target_lines:
+        print("No Austin Kennedy lines found. Check transcript format or speaker label.")
+        return []
+
+    embeddings = encode_normalized(model, target_lines, embedding_cache=embedding_cache)
+    similarities = window_similarities(embeddings, window=window)
+    boundaries = tiling_boundaries(similarities, depth_cutoff=depth_cutoff)
+    segments = _boundary_segments(target_lines, similarities, boundaries)
+    return [" ".join(lines) for lines in size_segments(segments, min_tokens, max_tokens)]
+
+def chunk_transcript(file_path, method="qa", target_label="Austin Kennedy",
+                     interviewer_label="Speaker A", threshold=0.6, window=3, model=None,
+                     embedding_cache=None, progress=None, min_tokens=0, max_tokens=0):
+    """
+    Parse a transcript file and chunk it for the target speaker.
+
+    This is the in-memory entry point shared by the CLI and the Flask app.
+    Labels are matched case-insensitively. `progress(stage, **info)` is called
+    with 'parsed' once the file has been read. `min_tokens`/`max_tokens` bound
+    the size of semantic and tiling chunks (0 = no bound).
+
+    Returns:
+      A list of text chunks (strings), in transcript order.
+    """
+    target_label = target_label.lower()
+    interviewer_label = interviewer_label.lower()
+
+    # Define what lines count as a speaker.
+    speakers_of_interest = {target_label, interviewer_label}
+
+    # Parse the transcript
+    with metrics.stage('parse'):
+        transcript_data = parse_transcript_no_colon(file_path, speakers_of_interest)
+    metrics.record_items('parse', len(transcript_data))
+    if progress is not None:
+        progress('parsed', utterances=len(transcript_data))
 
+    # Chunk
+    if method not in ("qa", "semantic", "tiling"):
+        raise ValueError(f"Unknown chunking method: {method}")
+    with metrics.stage('chunk'):
+        if method == "qa":
+            chunks = chunk_by_qa(
+                transcript_data,
+                target_label=target_label,
+                interviewer_label=interviewer_label
+            )
+        elif method == "semantic":
+            chunks = chunk_by_semantic(
+                transcript_data,
+                target_label=target_label,
+                threshold=threshold,
+                model=model,
+                embedding_cache=embedding_cache,
+                min_tokens=min_tokens,
+                max_tokens=max_tokens
+            )
+        else:
+            chunks = chunk_by_tiling(
+                transcript_data,
+                target_label=target_label,
+                window=window,
+                model=model,
+                embedding_cache=embedding_cache,
+                min_tokens=min_tokens,
+                max_tokens=max_tokens
+            )
+    metrics.record_items('chunk', len(chunks))
     return chunks
 
+def iter_chunk_transcript(file_path, method="qa", target_label="Austin Kennedy",
+                          interviewer_label="Speaker A", threshold=0.6, window=3, model=None,
+                          embedding_cache=None, progress=None, min_tokens=0, max_tokens=0, cancel_event=None):
+    """
+    Generator version of chunk_transcript: parses the file lazily and yields
+    chunks as their boundaries are found, so downstream stages can start
+    before the whole transcript is processed. Tiling needs global statistics
+    and so yields only after the whole file has been embedded. Setting
+    `cancel_event` stops parsing and embedding with ChunkingCancelled.
+    """
+    target_label = target_label.lower()
+    interviewer_label = interviewer_label.lower()
+    speakers_of_interest = {target_label, interviewer_label}
+
+    def parsed():
+        count = 0
+        for utterance in iter_transcript_no_colon(file_path, speakers_of_interest):
+            _check_cancelled(cancel_event)
+            count += 1
+            yield utterance
+        if progress is not None:
+            progress('parsed', utterances=count)
+
+    # Time parsing and chunking separately, though they run interleaved
+    utterances = metrics.timed_iter(parsed(), 'parse')
+    if method == "qa":
+        chunks = iter_chunks_by_qa(utterances, target_label=target_label, interviewer_label=interviewer_label)
+    elif method == "semantic":
+        chunks = iter_chunks_by_semantic(utterances, target_label=target_label, threshold=threshold,
+                                         model=model, embedding_cache=embedding_cache,
+                                         min_tokens=min_tokens, max_tokens=max_tokens, cancel_event=cancel_event)
+    elif method == "tiling":
+        def tiled():
+            utterance_list = list(utterances)
+            _check_cancelled(cancel_event)
+            yield from chunk_by_tiling(utterance_list, target_label=target_label, window=window,
+                                       model=model, embedding_cache=embedding_cache,
+                                       min_tokens=min_tokens, max_tokens=max_tokens)
+        chunks = tiled()
+    else:
+        raise ValueError(f"Unknown chunking method: {method}")
+    yield from metrics.timed_iter(chunks, 'chunk')
+
+def chunk_transcript_multi(file_path, target_labels, method="qa", interviewer_label="Speaker A",
+                           threshold=0.6, window=3, model=None, embedding_cache=None, progress=None,
+                           min_tokens=0, max_tokens=0):
+    """
+    Chunk a transcript for several target speakers in one pass.
+
+    The file is parsed once with speaker labels interned to integer IDs, and
+    for the embedding-based methods every target utterance is embedded in a
+    single batch. Each speaker's chunks are then derived from their own rows,
+    exactly as chunk_transcript would for that speaker alone, so the cost
+    barely grows with the number of speakers.
+
+    Returns:
+      {target_label: [chunks]} with the labels as given, chunks in transcript order.
+    """
+    index = SpeakerIndex([interviewer_label])
+    interviewer_id = index.id_of(interviewer_label)
+    target_ids = list(dict.fromkeys(index.intern(label) for label in target_labels))
+
+    utterances = list(iter_transcript_ids(file_path, index))
+    if progress is not None:
+        progress('parsed', utterances=len(utterances))
+
+    chunks = {speaker_id: [] for speaker_id in target_ids}
+    if method == "qa":
+        current = {speaker_id: [] for speaker_id in target_ids}
+        for speaker_id, text in utterances:
+            if speaker_id == interviewer_id:
+                # The interviewer ends every guest's current chunk
+                for key, lines in current.items():
+                    if lines:
+                        chunks[key].append(" ".join(lines))
+                        current[key] = []
+            elif speaker_id in current:
+                current[speaker_id].append(text)
+        for key, lines in current.items():
+            if lines:
+                chunks[key].append(" ".join(lines))
+    elif method in ("semantic", "tiling"):
+        if model is None:
+            model = get_model()
+        targets = set(target_ids) - {interviewer_id}
+        rows = [(speaker_id, text) for speaker_id, text in utterances if speaker_id in targets]
+        if rows:
+            embeddings = encode_normalized(model, [text for _, text in rows], embedding_cache=embedding_cache)
+            speakers = np.fromiter((speaker_id for speaker_id, _ in rows), dtype=np.int64, count=len(rows))
+            # Group rows by speaker in one stable sort, keeping transcript order within each
+            order = np.argsort(speakers, kind='stable')
+            ids, starts = np.unique(speakers[order], return_index=True)
+            for speaker_id, positions in zip(ids, np.split(order, starts[1:])):
+                lines = [rows[p][1] for p in positions]
+                if method == "semantic":
+                    similarities = adjacent_similarities(embeddings[positions])
+                    boundaries = np.flatnonzero(similarities < threshold)
+                else:
+                    similarities = window_similarities(embeddings[positions], window=window)
+                    boundaries = tiling_boundaries(similarities)
+                segments = _boundary_segments(lines, similarities, boundaries)
+                chunks[int(speaker_id)] = [" ".join(group) for group in size_segments(segments, min_tokens,
+                                                                                      max_tokens)]
+    else:
+        raise ValueError(f"Unknown chunking method: {method}")
+
+    return {label: chunks[index.id_of(label)] for label in target_labels}
+
+def _parse_for_batch(job):
+    """Process-pool worker: parse one transcript into utterance spans."""
+    file_path, speakers_of_interest = job
+    return file_path, list(iter_transcript_spans(file_path, speakers_of_interest))
+
+def _chunk_groups(spans, method, target_label, interviewer_label, threshold, window, embeddings,
+                  min_tokens=0, max_tokens=0):
+    """
+    Chunk one parsed file and return, per chunk, the list of utterance indices
+    (into `spans`) that make it up. `embeddings` holds the target speaker's
+    lines, in order, for the embedding-based methods, whose chunks are also
+    kept within the token bounds.
+    """
+    if method == "qa":
+        groups = []
+        current = []
+        for i, span in enumerate(spans):
+            spk_lower = span[0].lower()
+            if interviewer_label in spk_lower:
+                if current:
+                    groups.append(current)
+                    current = []
+            elif target_label in spk_lower:
+                current.append(i)
+        if current:
+            groups.append(current)
+        return groups
+
+    targets = [i for i, span in enumerate(spans) if target_label in span[0].lower()]
+    if not targets:
+        return []
+    if method == "semantic":
+        similarities = adjacent_similarities(embeddings)
+        boundaries = np.flatnonzero(similarities < threshold)
+    else:
+        similarities = window_similarities(embeddings, window=window)
+        boundaries = tiling_boundaries(similarities)
+    starts = [0] + [int(b) + 1 for b in boundaries]
+    ends = starts[1:] + [len(targets)]
+    segments = ((targets[s:e], [spans[i][1] for i in targets[s:e]], similarities[s:e - 1])
+                for s, e in zip(starts, ends))
+    return list(size_segments(segments, min_tokens, max_tokens))
+
+def batch_output_path(out_dir, file_path, root):
+    """JSON Lines output path for `file_path`, mirroring its path under `root`."""
+    relative = os.path.relpath(os.path.abspath(file_path), root)
+    name = os.path.splitext(relative)[0].replace(os.sep, "__")
+    return os.path.join(out_dir, f"{name}.jsonl")
+
+def _write_batch_output(output_path, file_path, spans, groups):
+    # Write to a temporary name first so an interrupted run never leaves a
+    # partial file that a resumed run would mistake for finished output.
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out_f:
+        for chunk_index, group in enumerate(groups, start=1):
+            record = {
+                "file": file_path,
+                "chunk_index": chunk_index,
+                "text": " ".join(spans[i][1] for i in group),
+                "start_line": spans[group[0]][2],
+                "end_line": spans[group[-1]][3],
+                "start_utterance": group[0],
+                "end_utterance": group[-1]
+            }
+            out_f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+
+def run_batch(file_paths, out_dir, method="qa", target_label="Austin Kennedy", interviewer_label="Speaker A",
+              threshold=0.6, window=3, workers=None, embed_batch_size=4096, model=None, embedding_cache=None,
+              min_tokens=0, max_tokens=0):
+    """
+    Chunk many transcripts in one run.
+
+    Files are parsed in parallel on a process pool. For the embedding-based
+    methods, target lines from many files are embedded together in batches of
+    about `embed_batch_size` lines on one shared model. Each file's chunks go
+    to `<out_dir>/<name>.jsonl`, one JSON object per chunk with the file,
+    chunk index, text and line/utterance offsets. Files that already have an
+    output file are skipped, so an interrupted run can simply be restarted.
+
+    Returns:
+      A dict of run statistics (files, utterances, chunks, seconds, rates).
+    """
+    target_label = target_label.lower()
+    interviewer_label = interviewer_label.lower()
+    speakers_of_interest = {target_label, interviewer_label}
+    os.makedirs(out_dir, exist_ok=True)
+
+    if not file_paths:
+        print("No transcript files found.")
+        return {"files": 0, "skipped": 0, "utterances": 0, "chunks": 0, "seconds": 0.0,
+                "files_per_sec": 0.0, "utterances_per_sec": 0.0}
+
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in file_paths])
+    outputs = {p: batch_output_path(out_dir, p, root) for p in file_paths}
+    todo = [p for p in file_paths if not os.path.exists(outputs[p])]
+    print(f"{len(todo)} file(s) to process, {len(file_paths) - len(todo)} already done.")
+
+    if method != "qa" and todo and model is None:
+        model = get_model()
+
+    stats = {"files": 0, "skipped": len(file_paths) - len(todo), "utterances": 0, "chunks": 0}
+    pending = []
+    pending_lines = [0]
+    start = time.perf_counter()
+
+    def flush():
+        if not pending:
+            return
+        embeddings = None
+        if method != "qa":
+            lines = [span[1] for _, spans in pending for span in spans if target_label in span[0].lower()]
+            if lines:
+                embeddings = encode_normalized(model, lines, embedding_cache=embedding_cache)
+        offset = 0
+        for file_path, spans in pending:
+            file_embeddings = None
+            if embeddings is not None:
+                count = sum(1 for span in spans if target_label in span[0].lower())
+                file_embeddings = embeddings[offset:offset + count]
+                offset += count
+            groups = _chunk_groups(spans, method, target_label, interviewer_label,
+                                   threshold, window, file_embeddings, min_tokens, max_tokens)
+            _write_batch_output(outputs[file_path], file_path, spans, groups)
+            stats["chunks"] += len(groups)
+        stats["files"] += len(pending)
+        pending.clear()
+        pending_lines[0] = 0
+        elapsed = time.perf_counter() - start
+        print(f"{stats['files']}/{len(todo)} files, {stats['utterances']} utterances "
+              f"({stats['files'] / elapsed:.1f} files/sec)")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [(p, speakers_of_interest) for p in todo]
+        for file_path, spans in pool.map(_parse_for_batch, jobs, chunksize=8):
+            pending.append((file_path, spans))
+            stats["utterances"] += len(spans)
+            pending_lines[0] += sum(1 for span in spans if target_label in span[0].lower())
+            if pending_lines[0] >= embed_batch_size:
+                flush()
+        flush()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    stats["files_per_sec"] = stats["files"] / elapsed if elapsed else 0.0
+    stats["utterances_per_sec"] = stats["utterances"] / elapsed if elapsed else 0.0
+    print(f"Processed {stats['files']} file(s), {stats['utterances']} utterances, {stats['chunks']} chunks "
+          f"in {elapsed:.1f}s: {stats['files_per_sec']:.2f} files/sec, "
+          f"{stats['utterances_per_sec']:.0f} utterances/sec.")
+    return stats
+
+def find_transcripts(input_dir=None, pattern=None):
+    """All .txt files under `input_dir` (recursively), or the files matching a glob `pattern`."""
+    if input_dir:
+        paths = []
+        for dirpath, _, filenames in os.walk(input_dir):
+            paths.extend(os.path.join(dirpath, name) for name in filenames if name.lower().endswith(".txt"))
+        return sorted(paths)
+    return sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+
 def main():
     parser = argparse.ArgumentParser(description="Chunk transcript for specified speaker lines (no colon format).")
-    parser.add_argument("--file", "-f", type=str, required=True,
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--file", "-f", type=str,
                         help="Path to the transcript text file.")
+    inputs.add_argument("--input_dir", type=str,
+                        help="Batch mode: chunk every .txt transcript under this directory.")
+    inputs.add_argument("--glob", type=str,
+                        help="Batch mode: chunk every transcript matching this glob (e.g. 'episodes/**/*.txt').")
     parser.add_argument("--method", "-m", type=str, default="qa",
-                        choices=["qa", "semantic"],
-                        help="Chunking method: 'qa' or 'semantic' (uses embeddings).")
+                        choices=["qa", "semantic", "tiling"],
+                        help="Chunking method: 'qa', 'semantic' or 'tiling' (both use embeddings).")
     parser.add_argument("--target_label", type=str, default="Austin Kennedy",
                         help="Label to identify target speaker lines. Case-insensitive match.")
+    parser.add_argument("--speakers", type=str, nargs="+", default=None,
+                        help="Several target speaker labels, chunked in a single pass (single-file mode only).")
     parser.add_argument("--interviewer_label", type=str, default="Speaker A",
                         help="Label to identify Interviewer lines. Case-insensitive match.")
     parser.add_argument("--threshold", type=float, default=0.6,
                         help="Similarity threshold for semantic chunking (0 to 1).")
+    parser.add_argument("--window", type=int, default=3,
+                        help="Number of lines per block for tiling chunking.")
+    parser.add_argument("--min_tokens", type=int, default=0,
+                        help="Merge semantic/tiling chunks shorter than this many tokens into a neighbour (0 = off).")
+    parser.add_argument("--max_tokens", type=int, default=0,
+                        help="Split semantic/tiling chunks longer than this many tokens at their weakest point (0 = off).")
+    parser.add_argument("--embedding_cache", type=str, default="",
+                        help="Optional directory for a persistent embedding cache (speeds up re-runs).")
     parser.add_argument("--output", "-o", type=str, default="",
                         help="Optional output file to save chunks. If omitted, prints to console.")
+    parser.add_argument("--out_dir", type=str, default="chunks",
+                        help="Batch mode: directory for the per-file .jsonl outputs.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Batch mode: parser processes (default: CPU count).")
+    parser.add_argument("--embed_batch_size", type=int, default=4096,
+                        help="Batch mode: lines embedded together across files.")
     args = parser.parse_args()
+    if args.speakers and not args.file:
+        parser.error("--speakers is only supported with --file")
 
-    # Define what lines count as a speaker.
-    speakers_of_interest = {args.target_label.lower(), args.interviewer_label.lower()}
+    embedding_cache = None
+    if args.embedding_cache and args.method != "qa":
+        from embedding_cache import EmbeddingCache
+        embedding_cache = EmbeddingCache(model_id(DEFAULT_MODEL_NAME, EMBEDDING_BACKEND), root=args.embedding_cache)
 
-    # Parse the transcript
-    transcript_data = parse_transcript_no_colon(args.file, speakers_of_interest)
+    if args.input_dir or args.glob:
+        try:
+            run_batch(
+                find_transcripts(args.input_dir, args.glob),
+                args.out_dir,
+                method=args.method,
+                target_label=args.target_label,
+                interviewer_label=args.interviewer_label,
+                threshold=args.threshold,
+                window=args.window,
+                workers=args.workers,
+                embed_batch_size=args.embed_batch_size,
+                embedding_cache=embedding_cache,
+                min_tokens=args.min_tokens,
+                max_tokens=args.max_tokens
+            )
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
 
-    # Chunk
-    if args.method == "qa":
-        chunks = chunk_by_qa(
-            transcript_data,
-            target_label=args.target_label.lower(),
-            interviewer_label=args.interviewer_label.lower()
-        )
-    else:
-        chunks = chunk_by_semantic(
-            transcript_data,
-            target_label=args.target_label.lower(),
-            threshold=args.threshold
+    if args.speakers:
+        try:
+            chunks_by_speaker = chunk_transcript_multi(
+                args.file,
+                args.speakers,
+                method=args.method,
+                interviewer_label=args.interviewer_label,
+                threshold=args.threshold,
+                window=args.window,
+                embedding_cache=embedding_cache,
+                min_tokens=args.min_tokens,
+                max_tokens=args.max_tokens
+            )
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+        for speaker, chunks in chunks_by_speaker.items():
+            print(f"=== {speaker}: {len(chunks)} chunk(s) ===\n")
+            for i, c in enumerate(chunks, start=1):
+                print(f"[CHUNK {i}]\n{c}\n{'-'*60}\n")
+        return
+
+    try:
+        chunks = chunk_transcript(
+            args.file,
+            method=args.method,
+            target_label=args.target_label,
+            interviewer_label=args.interviewer_label,
+            threshold=args.threshold,
+            window=args.window,
+            embedding_cache=embedding_cache,
+            min_tokens=args.min_tokens,
+            max_tokens=args.max_tokens
         )
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
     # Output
     if not chunks:
@@ -0,0 +1,181 @@
+"""
+In-process chunking service used by the Flask app.
+
+The app used to shell out to chunk_transcript.py for every upload, paying for a
+new interpreter, the sentence-transformers import and a model load each time.
+This module keeps one model per worker process (see chunk_transcript.get_model)
+and hands chunks back as a plain Python list.
+"""
+
+import os
+
+import metrics
+from chunk_transcript import (chunk_transcript, chunk_transcript_multi, iter_chunk_transcript,
+                              parse_transcript_no_colon, get_model, ChunkingCancelled, DEFAULT_MODEL_NAME)
+from embedding_backends import model_id, EMBEDDING_BACKEND
+from embedding_cache import get_embedding_cache
+from incremental import iter_chunk_incremental, has_state, INCREMENTAL_STATE_DIR
+
+# Chunking defaults for uploads; override through the environment.
+CHUNK_METHOD = os.getenv('CHUNK_METHOD', 'semantic')
+CHUNK_THRESHOLD = float(os.getenv('CHUNK_THRESHOLD', '0.6'))
+CHUNK_WINDOW = int(os.getenv('CHUNK_WINDOW', '3'))
+TARGET_LABEL = os.getenv('CHUNK_TARGET_LABEL', 'Austin Kennedy')
+INTERVIEWER_LABEL = os.getenv('CHUNK_INTERVIEWER_LABEL', 'Speaker A')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', DEFAULT_MODEL_NAME)
+# Caches and incremental state are keyed by this, so vectors from different backends never mix
+EMBEDDING_MODEL_ID = model_id(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+# Token bounds for semantic/tiling chunks, so each LLM request has a bounded cost (0 = no bound)
+CHUNK_MIN_TOKENS = int(os.getenv('CHUNK_MIN_TOKENS', '80'))
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '800'))
+
+def warm_up():
+    """
+    Load the embedding model and run one tiny encode so the first real request
+    doesn't pay for lazy initialisation. Safe to call more than once.
+    """
+    if CHUNK_METHOD not in ('semantic', 'tiling'):
+        return
+    model = get_model(EMBEDDING_MODEL)
+    model.encode(["warm up"])
+    print(f"Embedding model '{EMBEDDING_MODEL}' ({EMBEDDING_BACKEND} backend) loaded and warm.")
+
+def resolve_document_id(document_id, filename):
+    """
+    The id to chunk an upload under incrementally: the `document_id` the
+    client sent, or else `filename` if a previous upload already left state
+    under that name. Other uploads get None, so they never create state.
+    """
+    if document_id:
+        return document_id
+    if filename and CHUNK_METHOD == 'semantic' and has_state(filename, EMBEDDING_MODEL_ID):
+        return filename
+    return None
+
+def _iter_chunk_incremental(file_path, document_id, threshold, target_label, interviewer_label, progress,
+                            cancel_event=None):
+    target_label = (target_label or TARGET_LABEL).lower()
+    interviewer_label = (interviewer_label or INTERVIEWER_LABEL).lower()
+    with metrics.stage('parse'):
+        transcript_data = parse_transcript_no_colon(file_path, {target_label, interviewer_label})
+    metrics.record_items('parse', len(transcript_data))
+    if progress is not None:
+        progress('parsed', utterances=len(transcript_data))
+    chunks = iter_chunk_incremental(
+        transcript_data,
+        document_id,
+        EMBEDDING_MODEL_ID,
+        target_label=target_label,
+        threshold=CHUNK_THRESHOLD if threshold is None else threshold,
+        model=get_model(EMBEDDING_MODEL),
+        embedding_cache=get_embedding_cache(EMBEDDING_MODEL_ID),
+        min_tokens=CHUNK_MIN_TOKENS,
+        max_tokens=CHUNK_MAX_TOKENS,
+        progress=progress,
+        cancel_event=cancel_event
+    )
+    # Timed like iter_chunk_transcript's stages, so dedup's time stays its own
+    yield from metrics.timed_iter(chunks, 'chunk')
+
+def chunk_file(file_path, method=None, threshold=None,
+               target_label=None, interviewer_label=None, progress=None, document_id=None):
+    """
+    Chunk an uploaded transcript in-process.
+
+    Any argument left as None falls back to the module defaults above.
+    `progress(stage, **info)` receives 'parsed' once the file has been read.
+    With a `document_id`, semantic chunking reuses the state of that
+    document's previous upload (see incremental.py).
+
+    Returns:
+      A list of text chunks (strings), in transcript order.
+    """
+    method = method or CHUNK_METHOD
+    if document_id and method == 'semantic' and INCREMENTAL_STATE_DIR:
+        return list(_iter_chunk_incremental(file_path, document_id, threshold, target_label, interviewer_label,
+                                            progress))
+
+    model = None
+    embedding_cache = None
+    if method in ('semantic', 'tiling'):
+        model = get_model(EMBEDDING_MODEL)
+        embedding_cache = get_embedding_cache(EMBEDDING_MODEL_ID)
+
+    return chunk_transcript(
+        file_path,
+        method=method,
+        target_label=target_label or TARGET_LABEL,
+        interviewer_label=interviewer_label or INTERVIEWER_LABEL,
+        threshold=CHUNK_THRESHOLD if threshold is None else threshold,
+        window=CHUNK_WINDOW,
+        model=model,
+        embedding_cache=embedding_cache,
+        progress=progress,
+        min_tokens=CHUNK_MIN_TOKENS,
+        max_tokens=CHUNK_MAX_TOKENS
+    )
+
+def chunk_file_multi(file_path, target_labels, method=None, threshold=None,
+                     interviewer_label=None, progress=None):
+    """
+    Chunk an uploaded transcript for several target speakers in one parse and
+    one embedding pass (see chunk_transcript.chunk_transcript_multi).
+
+    Returns:
+      {target_label: [chunks]}, chunks in transcript order.
+    """
+    method = method or CHUNK_METHOD
+    model = None
+    embedding_cache = None
+    if method in ('semantic', 'tiling'):
+        model = get_model(EMBEDDING_MODEL)
+        embedding_cache = get_embedding_cache(EMBEDDING_MODEL_ID)
+
+    return chunk_transcript_multi(
+        file_path,
+        target_labels,
+        method=method,
+        interviewer_label=interviewer_label or INTERVIEWER_LABEL,
+        threshold=CHUNK_THRESHOLD if threshold is None else threshold,
+        window=CHUNK_WINDOW,
+        model=model,
+        embedding_cache=embedding_cache,
+        progress=progress,
+        min_tokens=CHUNK_MIN_TOKENS,
+        max_tokens=CHUNK_MAX_TOKENS
+    )
+
+def iter_chunk_file(file_path, method=None, threshold=None, target_label=None, interviewer_label=None,
+                    progress=None, document_id=None, cancel_event=None):
+    """
+    Like chunk_file, but yields chunks as soon as their boundaries are found
+    so filtering can overlap with parsing and embedding. Incremental runs
+    (with a `document_id`) parse the whole file before the first chunk, since
+    the diff needs every utterance. Setting `cancel_event` stops chunking
+    with ChunkingCancelled.
+    """
+    method = method or CHUNK_METHOD
+    if document_id and method == 'semantic' and INCREMENTAL_STATE_DIR:
+        return _iter_chunk_incremental(file_path, document_id, threshold, target_label, interviewer_label,
+                                       progress, cancel_event=cancel_event)
+
+    model = None
+    embedding_cache = None
+    if method in ('semantic', 'tiling'):
+        model = get_model(EMBEDDING_MODEL)
+        embedding_cache = get_embedding_cache(EMBEDDING_MODEL_ID)
+
+    return iter_chunk_transcript(
+        file_path,
+        method=method,
+        target_label=target_label or TARGET_LABEL,
+        interviewer_label=interviewer_label or INTERVIEWER_LABEL,
+        threshold=CHUNK_THRESHOLD if threshold is None else threshold,
+        window=CHUNK_WINDOW,
+        model=model,
+        embedding_cache=embedding_cache,
+        progress=progress,
+        min_tokens=CHUNK_MIN_TOKENS,
+        max_tokens=CHUNK_MAX_TOKENS,
+        cancel_event=cancel_event
+    )
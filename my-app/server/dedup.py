@@ -0,0 +1,121 @@
+"""
+Near-duplicate chunk elimination between chunking and filtering.
+
+Guests restate the same story across answers, and the chunkers can produce
+overlapping chunks, so the same material used to be scored and turned into a
+post more than once. Chunks are compared by MinHash signatures over word
+shingles, with locality-sensitive hashing (LSH) bands to find candidate
+pairs, so the cost grows with the number of chunks rather than with every
+pair of them. The first chunk of each cluster, in transcript order, is kept
+as its representative.
+"""
+
+import os
+import re
+import zlib
+
+import numpy as np
+
+# Estimated Jaccard similarity at or above which two chunks count as duplicates;
+# 0 disables deduplication.
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.7'))
+DEDUP_NUM_PERM = int(os.getenv('DEDUP_NUM_PERM', '128'))
+DEDUP_SHINGLE_SIZE = int(os.getenv('DEDUP_SHINGLE_SIZE', '3'))
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+def shingles(text, size=DEDUP_SHINGLE_SIZE):
+    """Set of hashed word n-grams of `text` (case and punctuation ignored)."""
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode('utf-8'))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode('utf-8'))
+            for i in range(len(words) - size + 1)}
+
+def lsh_params(threshold, num_perm):
+    """
+    Choose (bands, rows) with bands * rows <= num_perm so that the LSH
+    S-curve, (1/bands) ** (1/rows), sits as close to `threshold` as possible.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+class MinHashDeduplicator:
+    """
+    Streaming near-duplicate detector.
+
+    `add(text)` returns True when `text` starts a new cluster (keep it) and
+    False when it is a near-duplicate of a chunk seen earlier. Candidates come
+    from the LSH buckets and are confirmed against the signature estimate of
+    Jaccard similarity, so only a handful of comparisons are made per chunk.
+    """
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM,
+                 shingle_size=DEDUP_SHINGLE_SIZE, seed=1):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.RandomState(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2**64 with random odd 64-bit a,
+        # keeping the top 32 bits
+        high = rng.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64) << np.uint64(32)
+        self.a = (high | rng.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)) | np.uint64(1)
+        self.b = rng.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64) << np.uint64(32)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = []
+
+    def signature(self, text):
+        values = np.fromiter(shingles(text, self.shingle_size), dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            hashed = (values[:, None] * self.a + self.b) >> np.uint64(32)
+        return hashed.min(axis=0)
+
+    def add(self, text):
+        signature = self.signature(text)
+        keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+        candidates = set()
+        for bucket, key in zip(self.buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        for idx in candidates:
+            if np.mean(self.signatures[idx] == signature) >= self.threshold:
+                return False
+
+        idx = len(self.signatures)
+        self.signatures.append(signature)
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, []).append(idx)
+        return True
+
+def iter_dedup_chunks(chunks, threshold=None, progress=None):
+    """
+    Yield `chunks` without near-duplicates, keeping the first chunk of each
+    cluster in its original position. Reports 'deduplicated' with the kept
+    and removed counts through `progress(stage, **info)` once done.
+    """
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    if threshold <= 0:
+        yield from chunks
+        return
+
+    dedup = MinHashDeduplicator(threshold=threshold)
+    kept = 0
+    removed = 0
+    for chunk in chunks:
+        if dedup.add(chunk):
+            kept += 1
+            yield chunk
+        else:
+            removed += 1
+
+    print(f"Deduplication: {removed} near-duplicate chunk(s) removed, {kept} kept.")
+    if progress is not None:
+        progress('deduplicated', chunks=kept, removed=removed)
+
+def dedup_chunks(chunks, threshold=None):
+    """List version of iter_dedup_chunks."""
+    return list(iter_dedup_chunks(chunks, threshold=threshold))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+CPU embedding backends for semantic chunking.
+
+Our servers have no GPU, and embedding is the largest CPU cost of an upload.
+EMBEDDING_BACKEND selects how utterances are encoded:
+
+  - 'torch':     the sentence-transformers model in full precision (reference)
+  - 'onnx':      the same weights exported to ONNX and run with ONNX Runtime
+  - 'onnx-int8': the ONNX export with dynamically quantized int8 weights
+
+Every backend exposes the SentenceTransformer `encode` signature used by
+chunk_transcript.encode_normalized. EMBEDDING_BATCH_SIZE and
+EMBEDDING_THREADS (intra-op threads, 0 = library default) apply to all of
+them. Inputs are encoded longest-first so each batch pads to similar lengths.
+
+Check that a fast backend still finds the same chunk boundaries with:
+
+    python embedding_backends.py --file transcript.txt --backend onnx-int8
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', '0'))
+EMBEDDING_MAX_LENGTH = int(os.getenv('EMBEDDING_MAX_LENGTH', '256'))
+EMBEDDING_ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', os.path.join('cache', 'onnx'))
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+def model_id(model_name, backend):
+    """
+    Identity of the vectors a backend produces, for keying caches: the int8
+    model's embeddings differ slightly from the reference, so they are never
+    mixed with full-precision ones.
+    """
+    return model_name if backend == 'torch' else f"{model_name}:{backend}"
+
+def load_torch_model(model_name, threads=EMBEDDING_THREADS):
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name, device='cpu')
+
+def export_onnx(model_name, directory=EMBEDDING_ONNX_DIR, quantize=False):
+    """
+    Export `model_name`'s transformer to ONNX (once) and, with `quantize`,
+    write a dynamically quantized int8 copy next to it. Returns the path of
+    the requested model file.
+    """
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    target_dir = os.path.join(directory, slug)
+    fp32_path = os.path.join(target_dir, 'model.onnx')
+    int8_path = os.path.join(target_dir, 'model_int8.onnx')
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(target_dir, exist_ok=True)
+        print(f"Exporting '{model_name}' to ONNX at {fp32_path}...")
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        sample = AutoTokenizer.from_pretrained(model_name)(["export"], return_tensors='pt')
+        names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+        axes = {name: {0: 'batch', 1: 'sequence'} for name in names + ['last_hidden_state']}
+        tmp_path = f"{fp32_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(sample[name] for name in names), tmp_path,
+                              input_names=names, output_names=['last_hidden_state'],
+                              dynamic_axes=axes, opset_version=14)
+        os.replace(tmp_path, fp32_path)
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print(f"Quantizing {fp32_path} to int8...")
+        tmp_path = f"{int8_path}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+class OnnxEncoder:
+    """
+    Sentence encoder on ONNX Runtime: tokenizes, runs the exported
+    transformer and mean-pools token embeddings over the attention mask, as
+    the default all-MiniLM-L6-v2 pipeline does.
+    """
+    def __init__(self, model_name, quantize=False, threads=EMBEDDING_THREADS,
+                 batch_size=EMBEDDING_BATCH_SIZE, max_length=EMBEDDING_MAX_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(export_onnx(model_name, quantize=quantize), options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def encode(self, sentences, batch_size=None, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        if isinstance(sentences, str):
+            return self.encode([sentences], batch_size, convert_to_numpy, normalize_embeddings)[0]
+        batch_size = batch_size or self.batch_size
+        # Longest first, so every batch pads to lengths close to its own
+        order = np.argsort([-len(s) for s in sentences], kind='stable')
+        out = None
+        for start in range(0, len(sentences), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = self.tokenizer([sentences[i] for i in idx], padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors='np')
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = encoded['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if out is None:
+                out = np.empty((len(sentences), pooled.shape[1]), dtype=np.float32)
+            out[idx] = pooled
+        if out is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        if normalize_embeddings:
+            out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+        return out
+
+def load_model(model_name, backend=EMBEDDING_BACKEND):
+    """Load `model_name` on `backend` (one of BACKENDS)."""
+    if backend == 'torch':
+        return load_torch_model(model_name)
+    if backend == 'onnx':
+        return OnnxEncoder(model_name)
+    if backend == 'onnx-int8':
+        return OnnxEncoder(model_name, quantize=True)
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+def compare_boundaries(reference, candidate, tolerance=1):
+    """
+    How well `candidate` gap indices reproduce `reference` ones: a boundary
+    counts as matched when the other side has one within `tolerance`
+    utterances. Returns {'precision', 'recall', 'reference', 'candidate'}.
+    """
+    reference = np.asarray(reference)
+    candidate = np.asarray(candidate)
+
+    def matched(a, b):
+        if not len(a):
+            return 1.0
+        if not len(b):
+            return 0.0
+        pos = np.clip(np.searchsorted(b, a), 1, len(b)) - 1
+        nearest = np.minimum(np.abs(b[pos] - a), np.abs(b[np.minimum(pos + 1, len(b) - 1)] - a))
+        return float(np.mean(nearest <= tolerance))
+
+    return {
+        'precision': matched(candidate, reference),
+        'recall': matched(reference, candidate),
+        'reference': int(len(reference)),
+        'candidate': int(len(candidate))
+    }
+
+def main():
+    from chunk_transcript import (parse_transcript_no_colon, _target_lines, encode_normalized,
+                                  adjacent_similarities, DEFAULT_MODEL_NAME)
+    import time
+
+    parser = argparse.ArgumentParser(description="Check a fast embedding backend against the PyTorch reference.")
+    parser.add_argument("--file", "-f", type=str, required=True, help="Transcript to chunk.")
+    parser.add_argument("--backend", type=str, default="onnx-int8", choices=BACKENDS[1:])
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--target_label", type=str, default="Austin Kennedy")
+    parser.add_argument("--interviewer_label", type=str, default="Speaker A")
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--tolerance", type=int, default=1,
+                        help="Utterances a boundary may move and still count as matched.")
+    parser.add_argument("--min_agreement", type=float, default=0.95,
+                        help="Fail unless precision and recall both reach this.")
+    args = parser.parse_args()
+
+    target = args.target_label.lower()
+    data = parse_transcript_no_colon(args.file, {target, args.interviewer_label.lower()})
+    lines = _target_lines(data, target)
+    if len(lines) < 2:
+        print("Not enough target speaker lines to compare.")
+        sys.exit(1)
+
+    results = {}
+    for backend in ('torch', args.backend):
+        model = load_model(args.model, backend)
+        start = time.perf_counter()
+        embeddings = encode_normalized(model, lines)
+        elapsed = time.perf_counter() - start
+        similarities = adjacent_similarities(embeddings)
+        results[backend] = (similarities, np.flatnonzero(similarities < args.threshold))
+        print(f"{backend}: {len(lines)} utterances in {elapsed:.2f}s ({len(lines) / elapsed:.0f}/sec)")
+
+    reference_sims, reference_bounds = results['torch']
+    candidate_sims, candidate_bounds = results[args.backend]
+    report = compare_boundaries(reference_bounds, candidate_bounds, tolerance=args.tolerance)
+    print(f"Max similarity difference: {np.max(np.abs(reference_sims - candidate_sims)):.4f}")
+    print(f"Boundaries: {report['reference']} reference, {report['candidate']} {args.backend}; "
+          f"precision {report['precision']:.3f}, recall {report['recall']:.3f} (tolerance {args.tolerance})")
+    if min(report['precision'], report['recall']) < args.min_agreement:
+        print("Boundary agreement below the required minimum.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Disk-backed cache of utterance embeddings for semantic chunking.
+
+Each model gets its own directory holding a flat, memory-mappable vector file
+(`vectors.bin`, one fixed-size row per utterance) and a SQLite index from the
+utterance-text hash to its row. Writers serialise on a SQLite write
+transaction, so any number of processes can read while one appends.
+Re-chunking a known transcript with a different threshold or label only
+touches the cache; new utterances are encoded together in one batch.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+import metrics
+
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', os.path.join('cache', 'embeddings'))
+EMBEDDING_CACHE_DTYPE = os.getenv('EMBEDDING_CACHE_DTYPE', 'float32')
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Embedding store for a single model.
+
+    Parameters:
+      - model_id: name of the embedding model; vectors from different models never mix
+      - root: directory holding one sub-directory per model and dtype
+      - dtype: 'float32' or 'float16' on disk (lookups always return float32)
+    """
+    def __init__(self, model_id, root=EMBEDDING_CACHE_DIR, dtype=EMBEDDING_CACHE_DTYPE):
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        self.model_id = model_id
+        self.dtype = np.dtype(dtype)
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_id)
+        self.directory = os.path.join(root, f"{slug}-{dtype}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, 'vectors.bin')
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.dim = None
+        self._load_meta()
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'),
+                                    check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rows (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self.conn.commit()
+        self._mmap = None
+
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+
+    def _save_meta(self, dim):
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_id, 'dtype': self.dtype.name, 'dim': dim}, f)
+        self.dim = dim
+
+    def _vectors(self, min_rows):
+        """Memory-map the vector file, remapping if it has grown past our view."""
+        if self._mmap is None or len(self._mmap) < min_rows:
+            rows = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+            self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(rows, self.dim))
+        return self._mmap
+
+    def _lookup(self, hashes):
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            part = unique[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            found.update(self.conn.execute(
+                f"SELECT hash, row FROM rows WHERE hash IN ({placeholders})", part
+            ).fetchall())
+        return found
+
+    def lookup(self, hashes):
+        """Return {hash: row} for every hash already stored."""
+        with self.lock:
+            return self._lookup(hashes)
+
+    def store(self, hashes, vectors):
+        """Append `vectors` for `hashes` (skipping any another process stored first)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock:
+            # BEGIN IMMEDIATE takes SQLite's write lock, which also serialises
+            # appends to vectors.bin across processes.
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self._load_meta()
+                if self.dim is None:
+                    self._save_meta(vectors.shape[1])
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}")
+
+                existing = self._lookup(hashes)
+                new = list({h: v for h, v in zip(hashes, vectors) if h not in existing}.items())
+                if new:
+                    next_row = self.conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+                    block = np.stack([v for _, v in new]).astype(self.dtype)
+                    # Write at the committed end so a crashed writer's partial rows get overwritten
+                    mode = 'r+b' if os.path.exists(self.vectors_path) else 'wb'
+                    with open(self.vectors_path, mode) as f:
+                        f.seek(next_row * self.dim * self.dtype.itemsize)
+                        f.write(block.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.conn.executemany(
+                        "INSERT INTO rows (hash, row) VALUES (?, ?)",
+                        [(h, next_row + i) for i, (h, _) in enumerate(new)]
+                    )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def encode(self, lines, encode_fn):
+        """
+        Return an (n, d) float32 array of embeddings for `lines`.
+
+        Cached vectors are read from the memory-mapped file; every miss is
+        passed to `encode_fn(list_of_lines)` in a single call and stored.
+        """
+        hashes = [text_hash(line) for line in lines]
+        rows = self.lookup(hashes)
+
+        missing = list(dict.fromkeys(h for h in hashes if h not in rows))
+        fresh = {}
+        if missing:
+            text_by_hash = dict(zip(hashes, lines))
+            vectors = np.asarray(encode_fn([text_by_hash[h] for h in missing]), dtype=np.float32)
+            self.store(missing, vectors)
+            fresh = dict(zip(missing, vectors))
+
+        hits = len(lines) - sum(1 for h in hashes if h in fresh)
+        metrics.record_cache('embedding', hits=hits, misses=len(lines) - hits)
+
+        if not rows:
+            return np.stack([fresh[h] for h in hashes]) if hashes else np.zeros((0, self.dim or 0), dtype=np.float32)
+
+        with self.lock:
+            if self.dim is None:
+                self._load_meta()
+            stored = self._vectors(max(rows.values()) + 1)
+        out = np.empty((len(lines), self.dim), dtype=np.float32)
+        hit_positions = [i for i, h in enumerate(hashes) if h in rows]
+        out[hit_positions] = stored[[rows[hashes[i]] for i in hit_positions]]
+        for i, h in enumerate(hashes):
+            if h in fresh:
+                out[i] = fresh[h]
+        return out
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model_id):
+    """
+    Process-wide cache for `model_id`, or None when EMBEDDING_CACHE_DIR is set
+    to an empty string to disable caching.
+    """
+    if not EMBEDDING_CACHE_DIR:
+        return None
+    with _caches_lock:
+        cache = _caches.get(model_id)
+        if cache is None:
+            cache = EmbeddingCache(model_id)
+            _caches[model_id] = cache
+    return cache
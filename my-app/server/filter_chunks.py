@@ -1,6 +1,10 @@
 import re
 import os
 import sys
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import openai
 
@@ -13,81 +17,378 @@ except ImportError:
     print("OpenAI library not installed. Exiting.")
     sys.exit(1)
 
+import metrics
+from filter_engine import FilterEngine, LLMFilterError, FilterCancelled
+from verdict_cache import get_verdict_cache, make_key
+from prefilter import get_prefilter, log_verdicts
+from token_count import count_tokens
+
 # Load environment variables from .env file
 load_dotenv()
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+FILTER_MODEL = "gpt-4o-mini"
+FILTER_MAX_TOKENS = 200
+# Bump whenever the prompts or the JSON format below change.
+PROMPT_VERSION = "2"
+
+# Score categories returned by the model, each rated 1-5.
+CATEGORIES = ("substance", "statistics", "storytelling", "clarity")
+
+# Batch mode packs several chunks into one request under a token budget.
+# A batch size of 1 scores every chunk in its own request.
+FILTER_BATCH_SIZE = int(os.getenv('FILTER_BATCH_SIZE', '8'))
+FILTER_BATCH_TOKENS = int(os.getenv('FILTER_BATCH_TOKENS', '6000'))
+# Completion tokens reserved per chunk in a batch response.
+BATCH_TOKENS_PER_CHUNK = 60
+
+# Concurrency and rate limits for the LLM filter; override through the environment.
+FILTER_CONCURRENCY = int(os.getenv('FILTER_CONCURRENCY', '8'))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '500'))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TOKENS_PER_MINUTE', '200000'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '5'))
+
+_client = None
+
+def get_client():
+    """
+    Shared OpenAI client. Retries are handled by the filter engine, so the
+    client's own retry loop is disabled. Set OPENAI_BASE_URL to point it at a
+    local stub of the chat-completions endpoint.
+    """
+    global _client
+    if _client is None:
+        _client = openai.OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=os.getenv('OPENAI_BASE_URL') or None,
+            max_retries=0
+        )
+    return _client
+
 def word_count(text):
     return len(text.split())
 
 def passes_minimum_length(chunk_text, min_words=50):
     return word_count(chunk_text) >= min_words
 
+def estimate_tokens(text):
+    """Token count of `text` (tiktoken when installed, see token_count.py)."""
+    return count_tokens(text)
+
+SYSTEM_PROMPT = (
+    "You are an expert social media strategist. Your goal is to identify content chunks with strong substance, "
+    "credible statistics, and compelling storytelling to ensure high engagement and impact. "
+    "Consider including content that could be relatable, thought-provoking, or educational."
+)
+
+CRITERIA = """
+**Evaluation Criteria (Rate 1-5):**
+- **Substance:** Does the chunk provide valuable insights, meaningful information, or unique perspectives?
+- **Statistics:** Does the chunk include relevant statistics, quantifiable data, or credible references?
+- **Storytelling:** Are there compelling personal anecdotes, case studies, or real-world examples that make it engaging?
+- **Clarity:** Is the content clear, concise, and easily understandable by a broad audience?
+"""
+
+# Extra requests for a single chunk whose reply can't be parsed before it is
+# left unscored (rejected without caching) instead of failing the whole run.
+SCORE_PARSE_RETRIES = int(os.getenv('SCORE_PARSE_RETRIES', '1'))
+
+# Rough prompt overhead (system prompt, criteria, instructions) in tokens.
+PROMPT_OVERHEAD_TOKENS = 350
+
+class ScoreParseError(ValueError):
+    """The model's reply could not be parsed into per-chunk scores."""
+
+def estimate_request_tokens(chunk_text):
+    """Approximate prompt plus completion tokens for one single-chunk call."""
+    return estimate_tokens(chunk_text) + PROMPT_OVERHEAD_TOKENS + FILTER_MAX_TOKENS
+
+def estimate_batch_tokens(batch):
+    """Approximate prompt plus completion tokens for one batch call."""
+    return (sum(estimate_tokens(chunk) for chunk in batch)
+            + PROMPT_OVERHEAD_TOKENS + BATCH_TOKENS_PER_CHUNK * len(batch))
+
+def build_single_prompt(chunk_text):
+    return f"""
+You are an expert content analyst specializing in social media engagement. Analyze the following text chunk and evaluate it based on these criteria:
+
+---
+{chunk_text}
+---
+{CRITERIA}
+**Instructions:**
+Reply with only a JSON object of integer scores, for example:
+{{"substance": 3, "statistics": 1, "storytelling": 4, "clarity": 5}}
+"""
+
+def build_batch_prompt(batch):
+    numbered = "\n\n".join(f"[{i}]\n{chunk}" for i, chunk in enumerate(batch, start=1))
+    return f"""
+You are an expert content analyst specializing in social media engagement. Analyze each of the following {len(batch)} numbered text chunks independently and evaluate it based on these criteria:
+
+---
+{numbered}
+---
+{CRITERIA}
+**Instructions:**
+Reply with only a JSON object holding one entry per chunk, in order, for example:
+{{"scores": [{{"id": 1, "substance": 3, "statistics": 1, "storytelling": 4, "clarity": 5}}]}}
+"""
+
+def parse_scores(entry):
+    """Validate one score object and return {category: float}."""
+    if not isinstance(entry, dict):
+        raise ScoreParseError(f"Expected a JSON object, got {type(entry).__name__}")
+    scores = {}
+    for category in CATEGORIES:
+        value = entry.get(category)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ScoreParseError(f"Missing or non-numeric '{category}' score")
+        scores[category] = float(value)
+    return scores
+
+def parse_batch_scores(answer, batch_len):
+    """Parse a batch reply into a list of score dicts ordered by chunk id."""
+    try:
+        data = json.loads(answer)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ScoreParseError(f"Invalid JSON: {e}")
+    entries = data.get("scores") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        raise ScoreParseError("Expected a 'scores' array")
+
+    by_id = {}
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("id"), int):
+            by_id[entry["id"]] = parse_scores(entry)
+    if sorted(by_id) != list(range(1, batch_len + 1)):
+        raise ScoreParseError(f"Expected scores for ids 1..{batch_len}, got {sorted(by_id)}")
+    return [by_id[i] for i in range(1, batch_len + 1)]
+
+def passes_threshold(scores, threshold=2.5):
+    """A chunk passes if it meets the threshold in at least one category."""
+    return max(scores.values()) >= threshold
+
+def _complete_json(prompt, max_tokens, operation):
+    with metrics.llm_request('openai', operation) as call:
+        response = get_client().chat.completions.create(
+            model=FILTER_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.0,
+            response_format={"type": "json_object"}
+        )
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            call['usage'] = {
+                'prompt_tokens': usage.prompt_tokens or 0,
+                'completion_tokens': usage.completion_tokens or 0,
+                'cached_tokens': (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+            }
+    return response.choices[0].message.content
+
+def score_chunk(chunk_text):
+    """
+    Score one chunk. Returns {category: score}, or None if every reply
+    (the first plus SCORE_PARSE_RETRIES re-requests) was malformed; the
+    chunk is then rejected without its verdict being cached or logged.
+    """
+    for attempt in range(SCORE_PARSE_RETRIES + 1):
+        answer = _complete_json(build_single_prompt(chunk_text), FILTER_MAX_TOKENS, 'score')
+        try:
+            return parse_scores(json.loads(answer))
+        except (TypeError, json.JSONDecodeError, ScoreParseError) as e:
+            print(f"Could not parse score reply (attempt {attempt + 1}/{SCORE_PARSE_RETRIES + 1}): {e}")
+    print("Leaving chunk unscored after repeated malformed replies.")
+    return None
+
+def score_batch(batch):
+    """
+    Score several chunks in one request. Returns a list of score dicts in
+    batch order, or None if the reply couldn't be parsed (the caller then
+    falls back to scoring those chunks one at a time).
+    """
+    answer = _complete_json(build_batch_prompt(batch), BATCH_TOKENS_PER_CHUNK * len(batch) + 50, 'score_batch')
+    try:
+        return parse_batch_scores(answer, len(batch))
+    except ScoreParseError as e:
+        print(f"Could not parse batch of {len(batch)} chunk(s), falling back to single scoring: {e}")
+        return None
+
+def make_batches(chunks, max_batch_size=None, token_budget=None):
+    """
+    Greedily pack consecutive chunks into batches of at most `max_batch_size`
+    chunks whose estimated request cost stays under `token_budget`. A chunk
+    that alone exceeds the budget gets a batch of its own.
+    """
+    max_batch_size = max_batch_size or FILTER_BATCH_SIZE
+    token_budget = token_budget or FILTER_BATCH_TOKENS
+
+    batches = []
+    current = []
+    for chunk in chunks:
+        if current and (len(current) >= max_batch_size
+                        or estimate_batch_tokens(current + [chunk]) > token_budget):
+            batches.append(current)
+            current = []
+        current.append(chunk)
+    if current:
+        batches.append(current)
+    return batches
+
 def llm_filter_chunk(chunk_text, threshold=2.5):
     """
     Use OpenAI to analyze a chunk and decide if it's meaningful enough based on substance, statistics, and storytelling.
     If the chunk meets the criteria, the entire original chunk is returned; otherwise, None is returned.
+    API errors are raised to the caller rather than treated as a rejection.
     """
 
     if not _HAS_OPENAI:
         raise ImportError("OpenAI library is required but not installed.")
 
-    prompt = f""" 
-    You are an expert content analyst specializing in social media engagement. Analyze the following text chunk and evaluate it based on these criteria:
-
-    ---
-    {chunk_text}
-    ---
-
-    **Evaluation Criteria (Rate 1-5):**
-    - **Substance:** Does the chunk provide valuable insights, meaningful information, or unique perspectives? 
-    - **Use of Statistics:** Does the chunk include relevant statistics, quantifiable data, or credible references?
-    - **Storytelling:** Are there compelling personal anecdotes, case studies, or real-world examples that make it engaging?
-    - **Clarity:** Is the content clear, concise, and easily understandable by a broad audience?
-
-    **Instructions:**
-    1. Provide a score (1-5) for each evaluation criterion listed above.
-    2. Conclude by stating 'YES' if the chunk meets the threshold of {threshold} or more in at least one category; otherwise, state 'NO'.
-    3. If the chunk contains elements that might be useful for social media engagement or sparks interest, respond with 'YES'.
-    """
-
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are an expert social media strategist. Your goal is to identify content chunks with strong substance, "
-                "credible statistics, and compelling storytelling to ensure high engagement and impact. "
-                "Consider including content that could be relatable, thought-provoking, or educational."
-            )
-        },
-        {
-            "role": "user",
-            "content": prompt
-        }
-    ]
-    
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=200,
-            temperature=0.0
-        )
-        answer = response.choices[0].message.content
-        print(f"Analysis result:\n{answer}")
+    scores = score_chunk(chunk_text)
+    print(f"Analysis result: {scores}")
+
+    if scores is not None and passes_threshold(scores, threshold):
+        return chunk_text  # Return the original chunk if criteria are met
+    else:
+        return None  # Return None if criteria are not met
 
-        if "YES" in answer:
-            return chunk_text  # Return the original chunk if criteria are met
+def make_engine(score_fn, estimate, concurrency=None, on_progress=None, cancel_event=None):
+    """Build a FilterEngine for `score_fn` using the configured limits."""
+    return FilterEngine(
+        score_fn,
+        estimate_tokens=estimate,
+        concurrency=concurrency or FILTER_CONCURRENCY,
+        requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+        max_retries=OPENAI_MAX_RETRIES,
+        on_progress=on_progress,
+        cancel_event=cancel_event,
+        limit_key=FILTER_MODEL
+    )
+
+def score_chunks(chunks, batch_size=None, on_scored=None, cancel_event=None):
+    """
+    Score every chunk and return a list of score dicts in input order (None
+    for a chunk left unscored, see score_chunk).
+
+    Chunks are packed into batches and scored concurrently; any batch whose
+    reply can't be parsed is re-scored one chunk per request. `on_scored(n)`
+    is called as each request finishes with the number of chunks it scored.
+    """
+    batch_size = batch_size or FILTER_BATCH_SIZE
+
+    def report_one(chunk, result):
+        if on_scored:
+            on_scored(1)
+
+    def report_batch(batch, result):
+        # Unparseable batches are reported as their chunks are re-scored
+        if on_scored and result is not None:
+            on_scored(len(batch))
+
+    if batch_size <= 1:
+        return make_engine(score_chunk, estimate_request_tokens,
+                           on_progress=report_one, cancel_event=cancel_event).run(chunks)
+
+    batches = make_batches(chunks, max_batch_size=batch_size)
+    print(f"Scoring {len(chunks)} chunk(s) in {len(batches)} batch request(s).")
+    batch_results = make_engine(score_batch, estimate_batch_tokens,
+                                on_progress=report_batch, cancel_event=cancel_event).run(batches)
+
+    scores = []
+    retry_positions = []
+    for batch, result in zip(batches, batch_results):
+        if result is None:
+            retry_positions.extend(range(len(scores), len(scores) + len(batch)))
+            scores.extend([None] * len(batch))
         else:
-            return None  # Return None if criteria are not met
+            scores.extend(result)
+
+    if retry_positions:
+        retried = make_engine(score_chunk, estimate_request_tokens,
+                              on_progress=report_one, cancel_event=cancel_event).run(
+            [chunks[pos] for pos in retry_positions])
+        for pos, result in zip(retry_positions, retried):
+            scores[pos] = result
+    return scores
+
+def cached_verdicts(chunks, threshold=2.5, batch_size=None, cache=None, on_scored=None, cancel_event=None,
+                    prefilter=None):
+    """
+    Return a pass/fail verdict per chunk, in input order.
+
+    Verdicts already in the persistent cache come back without a network round
+    trip. The local pre-filter (see prefilter.py) then rejects clear misses;
+    only the remaining chunks are scored, and their verdicts are stored and
+    logged for pre-filter calibration.
+    """
+    cache = cache if cache is not None else get_verdict_cache()
+    prefilter = prefilter if prefilter is not None else get_prefilter()
+
+    keys = [make_key(chunk, FILTER_MODEL, PROMPT_VERSION, threshold) for chunk in chunks]
+    cached = cache.get_many(keys) if cache is not None else {}
+    if cache is not None:
+        hits = sum(1 for key in keys if key in cached)
+        metrics.record_cache('verdict', hits=hits, misses=len(keys) - hits)
+
+    # Score each distinct uncached chunk once, even if it repeats
+    pending = {}
+    for chunk, key in zip(chunks, keys):
+        if key not in cached and key not in pending:
+            pending[key] = chunk
+
+    # Local rejects are not cached: a recalibrated pre-filter may decide otherwise
+    predicted = {}
+    if prefilter is not None:
+        for key, chunk in list(pending.items()):
+            send, predicted[key] = prefilter.keep(chunk)
+            if not send:
+                cached[key] = (None, False)
+                del pending[key]
+        metrics.record_items('prefilter', len(pending))
+
+    if on_scored and len(chunks) > len(pending):
+        on_scored(len(chunks) - len(pending))
+
+    if pending:
+        scores = score_chunks(list(pending.values()), batch_size=batch_size,
+                              on_scored=on_scored, cancel_event=cancel_event)
+        entries = []
+        for key, chunk_scores in zip(pending, scores):
+            if chunk_scores is None:
+                # Unscored: rejected for this run only
+                cached[key] = (None, False)
+            else:
+                entries.append((key, chunk_scores, passes_threshold(chunk_scores, threshold)))
+        if cache is not None:
+            cache.put_many(entries)
+        log_verdicts((pending[key], chunk_scores, passed) for key, chunk_scores, passed in entries)
+        for key, chunk_scores, passed in entries:
+            cached[key] = (chunk_scores, passed)
+            if key in predicted:
+                prefilter.record_llm_verdict(predicted[key], passed)
 
-    except Exception as e:
-        print(f"Error calling OpenAI: {e}")
-        return False
+    if prefilter is not None:
+        print(f"Pre-filter: {prefilter.stats()}")
 
-def filter_chunks(chunks):
+    return [cached[key][1] for key in keys]
+
+def filter_chunks(chunks, threshold=2.5, batch_size=None, progress=None, cancel_event=None, prefilter=None):
     """
-    Process an array of chunks and return only the relevant ones.
+    Process an array of chunks and return only the relevant ones, in their original order.
+    Cached verdicts are reused; the rest are scored concurrently in batches and the
+    threshold is applied locally. Raises LLMFilterError if any chunk could not be scored.
+
+    `progress(stage, **info)` is called with 'scoring' and done/total counts as
+    chunks are scored; setting `cancel_event` stops scoring with FilterCancelled.
+    `prefilter` replaces the configured local pre-filter (any object with
+    keep/record_llm_verdict/stats, like prefilter.PreFilter).
     """
 
     if not chunks:
@@ -98,13 +399,183 @@ def filter_chunks(chunks):
 
     # Step 1: Apply minimum word count filter
     filtered_chunks = [chunk for chunk in chunks if passes_minimum_length(chunk, 50)]
+    metrics.record_items('length_filter', len(filtered_chunks))
     print(f"After length filter, {len(filtered_chunks)} chunks remain.")
 
     # Step 2: Apply OpenAI filtering
-    final_chunks = []
-    for chunk in filtered_chunks:
-        if llm_filter_chunk(chunk):
-            final_chunks.append(chunk)
+    on_scored = None
+    if progress is not None:
+        total = len(filtered_chunks)
+        done = [0]
+        lock = threading.Lock()
+
+        def on_scored(n):
+            with lock:
+                done[0] += n
+                progress('scoring', done=done[0], total=total)
+
+        progress('scoring', done=0, total=total)
+
+    with metrics.stage('filter'):
+        verdicts = cached_verdicts(filtered_chunks, threshold=threshold, batch_size=batch_size,
+                                   on_scored=on_scored, cancel_event=cancel_event, prefilter=prefilter)
+    final_chunks = [chunk for chunk, passed in zip(filtered_chunks, verdicts) if passed]
+    metrics.record_items('filter', len(final_chunks))
 
     print(f"After LLM filtering, {len(final_chunks)} chunks selected.")
     return final_chunks
+
+def iter_filter_chunks(chunks, threshold=2.5, batch_size=None, progress=None, cancel_event=None, cache=None,
+                       prefilter=None):
+    """
+    Streaming version of filter_chunks for pipelined processing.
+
+    Consumes `chunks` (any iterable, e.g. a chunker generator) and starts
+    scoring as soon as each chunk arrives, on a background pool, while the
+    caller keeps producing chunks. Accepted chunks are yielded in their
+    original order as soon as every earlier verdict is known.
+
+    Batches start at a single chunk and double up to `batch_size`, so the
+    first verdict needs only one chunk's worth of work. Cached verdicts are
+    reused, the local pre-filter applied and new verdicts stored, as in
+    filter_chunks.
+    """
+    batch_size = batch_size or FILTER_BATCH_SIZE
+    cache = cache if cache is not None else get_verdict_cache()
+    prefilter = prefilter if prefilter is not None else get_prefilter()
+    batch_engine = make_engine(score_batch, estimate_batch_tokens, cancel_event=cancel_event)
+    single_engine = make_engine(score_chunk, estimate_request_tokens, cancel_event=cancel_event)
+    pool = ThreadPoolExecutor(max_workers=FILTER_CONCURRENCY)
+
+    counts = {'received': 0, 'candidates': 0, 'sent': 0, 'scored': 0, 'accepted': 0}
+    # Scoring runs on the pool; its LLM calls are traced under the caller's trace
+    score_one = metrics.bind(single_engine.score)
+    score_many = metrics.bind(batch_engine.score)
+    entries = deque()  # one dict per candidate chunk, in input order
+    batch = []
+    next_batch_size = 1
+
+    def report():
+        if progress is not None:
+            progress('scoring', done=counts['scored'], total=counts['candidates'])
+
+    def submit_batch():
+        nonlocal batch, next_batch_size
+        if not batch:
+            return
+        if len(batch) == 1:
+            batch[0]['future'] = pool.submit(score_one, batch[0]['chunk'])
+        else:
+            ref = {'future': pool.submit(score_many, [e['chunk'] for e in batch]), 'entries': batch}
+            for entry in batch:
+                entry['batch'] = ref
+        batch = []
+        next_batch_size = min(next_batch_size * 2, batch_size)
+
+    def result_of(future, entry):
+        try:
+            return future.result()
+        except FilterCancelled:
+            raise
+        except Exception as e:
+            raise LLMFilterError([(entry['index'], e)])
+
+    def record(resolved):
+        resolved = list(resolved)
+        new_entries = []
+        for entry, scores in resolved:
+            counts['scored'] += 1
+            if scores is None:
+                # Unscored: rejected for this run only
+                entry['passed'] = False
+                continue
+            entry['passed'] = passes_threshold(scores, threshold)
+            new_entries.append((entry['key'], scores, entry['passed']))
+            if entry['predicted'] is not None:
+                prefilter.record_llm_verdict(entry['predicted'], entry['passed'])
+        if cache is not None:
+            cache.put_many(new_entries)
+        log_verdicts((entry['chunk'], scores, entry['passed']) for entry, scores in resolved
+                     if scores is not None)
+        report()
+
+    def ready(entry):
+        if entry['passed'] is not None:
+            return True
+        ref = entry['batch']
+        future = ref['future'] if ref is not None else entry['future']
+        return future is not None and future.done()
+
+    def resolve(entry):
+        if entry['passed'] is not None:
+            return
+        ref = entry['batch']
+        if ref is not None:
+            result = result_of(ref['future'], entry)
+            if result is not None:
+                record(zip(ref['entries'], result))
+                return
+            # Unparseable batch reply: score its chunks one at a time
+            for e in ref['entries']:
+                e['batch'] = None
+                e['future'] = pool.submit(score_one, e['chunk'])
+        record([(entry, result_of(entry['future'], entry))])
+
+    def drain(block):
+        while entries and (block or ready(entries[0])):
+            entry = entries.popleft()
+            resolve(entry)
+            if entry['passed']:
+                counts['accepted'] += 1
+                yield entry['chunk']
+
+    try:
+        for chunk in chunks:
+            if cancel_event is not None and cancel_event.is_set():
+                raise FilterCancelled()
+            counts['received'] += 1
+
+            # Step 1: Apply minimum word count filter
+            if not passes_minimum_length(chunk, 50):
+                continue
+
+            entry = {'index': counts['candidates'], 'chunk': chunk, 'passed': None,
+                     'key': make_key(chunk, FILTER_MODEL, PROMPT_VERSION, threshold),
+                     'predicted': None, 'batch': None, 'future': None}
+            counts['candidates'] += 1
+            entries.append(entry)
+
+            # Step 2: Reuse a cached verdict, reject clear misses locally, or
+            # queue the chunk for OpenAI filtering
+            hit = cache.get_many([entry['key']]) if cache is not None else {}
+            if cache is not None:
+                metrics.record_cache('verdict', hits=len(hit), misses=1 - len(hit))
+            send = True
+            if not hit and prefilter is not None:
+                send, entry['predicted'] = prefilter.keep(chunk)
+            if hit or not send:
+                entry['passed'] = hit[entry['key']][1] if hit else False
+                counts['scored'] += 1
+                report()
+            else:
+                counts['sent'] += 1
+                if batch and estimate_batch_tokens([e['chunk'] for e in batch] + [chunk]) > FILTER_BATCH_TOKENS:
+                    submit_batch()
+                batch.append(entry)
+                if len(batch) >= next_batch_size:
+                    submit_batch()
+
+            yield from drain(block=False)
+
+        submit_batch()
+        yield from drain(block=True)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        metrics.record_items('length_filter', counts['candidates'])
+        if prefilter is not None:
+            metrics.record_items('prefilter', counts['sent'])
+
+    print(f"Total chunks received: {counts['received']}, {counts['candidates']} after length filter.")
+    if prefilter is not None:
+        print(f"Pre-filter: {prefilter.stats()}")
+    print(f"After LLM filtering, {counts['accepted']} chunks selected.")
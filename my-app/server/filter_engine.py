@@ -0,0 +1,187 @@
+"""
+Concurrent, rate-limited engine for scoring chunks with an LLM.
+
+filter_chunks used to call the API one chunk at a time, so a request took the
+sum of every round trip. The engine runs calls on a thread pool, keeps them
+under a requests-per-minute and tokens-per-minute budget, retries 429/5xx with
+jittered exponential backoff and returns results in the original order.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import openai
+
+import metrics
+
+class LLMFilterError(Exception):
+    """
+    Raised when one or more chunks could not be scored after all retries.
+    `failures` is a list of (chunk_index, exception) tuples.
+    """
+    def __init__(self, failures):
+        self.failures = failures
+        details = "; ".join(f"chunk {idx}: {err}" for idx, err in failures[:5])
+        super().__init__(f"{len(failures)} chunk(s) failed LLM scoring ({details})")
+
+class FilterCancelled(Exception):
+    """Raised when scoring is stopped through the engine's cancel event."""
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    `acquire(n)` blocks until n tokens are available. A rate of 0 or None
+    disables the limit.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = (rate_per_minute or 0) / 60.0
+        self.capacity = capacity or rate_per_minute or 0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if not self.rate:
+            return
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def shared_buckets(limit_key, requests_per_minute, tokens_per_minute):
+    """
+    The process-wide (request bucket, token bucket) pair for `limit_key`
+    (e.g. a model name). Every engine scoring against the same key draws
+    from the same per-minute budget, so concurrent uploads, retry passes
+    and batch/single engines together stay under the configured limits.
+    """
+    key = (limit_key, requests_per_minute, tokens_per_minute)
+    with _buckets_lock:
+        buckets = _buckets.get(key)
+        if buckets is None:
+            buckets = _buckets[key] = (TokenBucket(requests_per_minute), TokenBucket(tokens_per_minute))
+    return buckets
+
+def is_retryable(error):
+    """True for rate limits, server errors and transport failures."""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def call_with_retries(fn, max_retries=5, base_delay=0.5, max_delay=30.0, retryable=is_retryable,
+                      provider='openai'):
+    """
+    Call `fn()` and retry errors for which `retryable(error)` is true with
+    full-jitter exponential backoff. Honours a Retry-After header when the
+    server sends one. Retries are counted under `provider` in the metrics.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            response = getattr(e, 'response', None)
+            retry_after = response.headers.get('retry-after') if response is not None else None
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            attempt += 1
+            metrics.record_retry(provider)
+            print(f"Retrying LLM call in {delay:.2f}s (attempt {attempt}/{max_retries}): {e}")
+            time.sleep(delay)
+
+class FilterEngine:
+    """
+    Score many items concurrently with `score_fn(item)`.
+
+    Parameters:
+      - score_fn: callable taking one item and returning its result
+      - estimate_tokens: callable giving the token cost of one item's request
+      - concurrency: maximum number of in-flight requests
+      - requests_per_minute / tokens_per_minute: token-bucket limits (0 = off),
+        shared with every other engine using the same `limit_key`
+      - limit_key: name of the rate-limit budget (e.g. the model)
+      - max_retries: retries per item for 429/5xx/connection errors
+      - on_progress: optional callable invoked as on_progress(item, result)
+        once each item is scored
+      - cancel_event: optional threading.Event; once set, items that haven't
+        started are skipped and run() raises FilterCancelled
+    """
+    def __init__(self, score_fn, estimate_tokens=None, concurrency=8,
+                 requests_per_minute=500, tokens_per_minute=200000, max_retries=5,
+                 on_progress=None, cancel_event=None, limit_key='openai'):
+        self.score_fn = score_fn
+        self.estimate_tokens = estimate_tokens or (lambda item: 0)
+        self.concurrency = max(1, concurrency)
+        self.request_bucket, self.token_bucket = shared_buckets(limit_key, requests_per_minute,
+                                                                tokens_per_minute)
+        self.max_retries = max_retries
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+
+    def _cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def score(self, item):
+        """Score one item on the calling thread, with rate limiting and retries."""
+        def attempt():
+            if self._cancelled():
+                raise FilterCancelled()
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(self.estimate_tokens(item))
+            return self.score_fn(item)
+        return call_with_retries(attempt, max_retries=self.max_retries)
+
+    def run(self, items):
+        """
+        Score `items` and return their results in input order.
+        Raises LLMFilterError listing every item that still failed after retries.
+        """
+        if not items:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items))) as pool:
+            score = metrics.bind(self.score)
+            futures = [pool.submit(score, item) for item in items]
+            if self.on_progress is not None:
+                positions = {future: idx for idx, future in enumerate(futures)}
+                for future in as_completed(futures):
+                    if future.exception() is None:
+                        self.on_progress(items[positions[future]], future.result())
+
+        if self._cancelled():
+            raise FilterCancelled()
+
+        results = []
+        failures = []
+        for idx, future in enumerate(futures):
+            error = future.exception()
+            if error is not None:
+                failures.append((idx, error))
+                results.append(None)
+            else:
+                results.append(future.result())
+
+        if failures:
+            raise LLMFilterError(failures)
+        return results
@@ -1,29 +1,146 @@
 import os
 import anthropic
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+import metrics
+from filter_engine import call_with_retries
+
 # Load environment variables from .env file
 load_dotenv()
 
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
 
+GENERATION_MODEL = "claude-3-5-sonnet-20241022"
+GENERATION_MAX_TOKENS = 1000
+GENERATION_TEMPERATURE = 0.7
+
+# Bulk generation: posts generated at once and retries per post for 429/5xx/overloaded.
+GENERATION_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '4'))
+ANTHROPIC_MAX_RETRIES = int(os.getenv('ANTHROPIC_MAX_RETRIES', '5'))
+
+SYSTEM_PROMPT = "You are a helpful assistant that helps me turn a transcript into LinkedIn posts."
 
-if not ANTHROPIC_API_KEY:
-    raise ValueError("Anthropic API key is missing. Please check your .env file.")
+INSTRUCTIONS = """
+    Attached is a style sheet that I want you to use to create this post.
+    Now, taking the content from this transcript, turn it into a post that takes specific details and words from this quote and turns it into a LinkedIn post.
+    It should be packaged for LinkedIn, while still fitting the stylesheet. Use good copywriting tactics.
+    Attached are the stylesheet and the transcription of a recent Instagram reel he posted. Don't use emojis and only output the post. Keep it between 500 and 1000 characters.
+"""
+
+_client = None
+_client_lock = threading.Lock()
 
-# Initialize Anthropic client
-anthropic_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+def get_client():
+    """
+    Shared Anthropic client. Retries are handled by call_with_retries, so the
+    client's own retry loop is disabled.
+    """
+    global _client
+    if not ANTHROPIC_API_KEY:
+        raise ValueError("Anthropic API key is missing. Please check your .env file.")
+    with _client_lock:
+        if _client is None:
+            _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
+    return _client
 
 def read_file_content(file_path):
     """Read content from a file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
             return f.read()
     except Exception as e:
         print(f"Error reading file {file_path}: {e}")
         return None
 
+_styles = {}
+_styles_lock = threading.Lock()
+
+def load_style(style_file):
+    """
+    Contents of the style sheet at `style_file`, read once and reused until
+    the file changes on disk. Returns None if it cannot be read.
+    """
+    try:
+        mtime = os.path.getmtime(style_file)
+    except OSError as e:
+        print(f"Error reading file {style_file}: {e}")
+        return None
+    with _styles_lock:
+        cached = _styles.get(style_file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    content = read_file_content(style_file)
+    if content is not None:
+        with _styles_lock:
+            _styles[style_file] = (mtime, content)
+    return content
+
+def is_retryable(error):
+    """True for rate limits, overload, server errors and transport failures."""
+    if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (429, 529) or error.status_code >= 500
+    return False
+
+def build_request(style_content, transcript_content):
+    """
+    Keyword arguments for messages.create.
+
+    The style sheet is the same for every post, so it goes in the system
+    prompt behind a cache breakpoint; repeated calls read it from the prompt
+    cache instead of paying full input-token cost for it. Only the transcript
+    content differs from call to call.
+    """
+    return {
+        "model": GENERATION_MODEL,
+        "max_tokens": GENERATION_MAX_TOKENS,
+        "temperature": GENERATION_TEMPERATURE,
+        "system": [
+            {"type": "text", "text": SYSTEM_PROMPT},
+            {"type": "text", "text": f"Writing style:\n{style_content}",
+             "cache_control": {"type": "ephemeral"}}
+        ],
+        "messages": [
+            {
+                "role": "user",
+                "content": f"{INSTRUCTIONS}\n    Transcript content:\n    {transcript_content}\n"
+            }
+        ]
+    }
+
+def usage_counts(usage):
+    """
+    Token counts of an Anthropic usage object for metrics.record_llm_request:
+    prompt tokens billed at the input rate (cache writes included) and
+    prompt tokens read from the prompt cache.
+    """
+    if usage is None:
+        return {}
+    return {
+        'prompt_tokens': (getattr(usage, 'input_tokens', 0) or 0)
+                         + (getattr(usage, 'cache_creation_input_tokens', 0) or 0),
+        'completion_tokens': getattr(usage, 'output_tokens', 0) or 0,
+        'cached_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0
+    }
+
+def create_message(request, max_retries=ANTHROPIC_MAX_RETRIES):
+    """messages.create with retries; every attempt's latency and usage is recorded."""
+    def attempt():
+        with metrics.llm_request('anthropic', 'generate') as call:
+            response = get_client().messages.create(**request)
+            call['usage'] = usage_counts(getattr(response, 'usage', None))
+        return response
+    return call_with_retries(attempt, max_retries=max_retries, retryable=is_retryable, provider='anthropic')
+
+def response_text(response):
+    """Concatenated text blocks of a messages response."""
+    return ''.join(block.text for block in response.content if hasattr(block, 'text')).strip()
+
 def generate_content(style_file: str, transcript_file: str) -> str:
     """
     Generate content using Anthropic Claude based on a fixed prompt.
@@ -43,44 +160,12 @@ def generate_content(style_file: str, transcript_file: str) -> str:
     if not style_content or not transcript_content:
         return "Failed to read style or transcript files."
 
-    # Fixed prompt
-    full_prompt = f"""
-    Attached is a style sheet that I want you to use to create this post.  
-    Now, taking the content from this transcript, turn it into a post that takes specific details and words from this quote and turns it into a LinkedIn post. 
-    It should be packaged for LinkedIn, while still fitting the stylesheet. Use good copywriting tactics. 
-    Attached are the stylesheet and the transcription of a recent Instagram reel he posted. Don't use emojis and only output the post. Keep it between 500 and 1000 characters.
-
-    Writing style:
-    {style_content}
-
-    Transcript content:
-    {transcript_content}
-    """
-
     try:
-        response = anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.7,
-            system="You are a helpful assistant that helps me turn a transcript into LinkedIn posts.",
-            messages=[
-                {
-                    "role": "user",
-                    "content": full_prompt
-                }
-            ]
-        )
-
-        # Debug: Print the type and content of the response to understand its structure
-        print("Response type:", type(response))
-        print("Response content:", response)
+        response = create_message(build_request(style_content, transcript_content))
 
         # Accessing the content attribute directly
         if hasattr(response, 'content'):
-            text_blocks = response.content
-            text_response = ''.join(
-                block.text for block in text_blocks if hasattr(block, 'text')
-            )
+            text_response = response_text(response)
         else:
             text_response = "No 'content' attribute in response."
 
@@ -93,5 +178,93 @@ def generate_content(style_file: str, transcript_file: str) -> str:
         print(f"Error generating content: {e}")
         return "Failed to generate content."
 
+def generate_post(style_content, chunk_text, max_retries=ANTHROPIC_MAX_RETRIES):
+    """
+    Generate one post for `chunk_text`, retrying 429/5xx/overloaded errors with
+    backoff. Returns the post text; raises on failure or an empty reply.
+    """
+    response = create_message(build_request(style_content, chunk_text), max_retries=max_retries)
+    text = response_text(response)
+    if not text:
+        raise ValueError("No valid text response found in API response.")
+    return text
+
+def iter_generate_post(style_content, chunk_text, max_retries=ANTHROPIC_MAX_RETRIES):
+    """
+    Stream one post for `chunk_text`, yielding text deltas as they arrive.
+
+    Opening the stream is retried like generate_post; an error after text
+    has been yielded is raised to the caller. Closing the generator early
+    (e.g. when the client disconnects) closes the HTTP stream, which stops
+    generation and token billing.
+    """
+    request = build_request(style_content, chunk_text)
+
+    def open_stream():
+        with metrics.llm_request('anthropic', 'stream_open'):
+            return get_client().messages.create(**request, stream=True)
+
+    stream = call_with_retries(open_stream, max_retries=max_retries, retryable=is_retryable, provider='anthropic')
+    # The whole stream counts as one 'stream' request; usage arrives in its events
+    start = time.perf_counter()
+    usage = {}
+    outcome = 'error'
+    try:
+        for event in stream:
+            if event.type == 'message_start':
+                usage.update(usage_counts(getattr(event.message, 'usage', None)))
+            elif event.type == 'message_delta' and getattr(event, 'usage', None) is not None:
+                usage['completion_tokens'] = getattr(event.usage, 'output_tokens', 0) or 0
+            elif event.type == 'content_block_delta' and getattr(event.delta, 'type', None) == 'text_delta':
+                yield event.delta.text
+        outcome = 'ok'
+    except GeneratorExit:
+        outcome = 'cancelled'
+        raise
+    finally:
+        stream.close()
+        metrics.record_llm_request('anthropic', 'stream', time.perf_counter() - start, outcome=outcome,
+                                   start=start, **usage)
+
+def generate_posts(chunks, style_file=None, style_content=None, concurrency=None,
+                   max_retries=ANTHROPIC_MAX_RETRIES):
+    """
+    Generate a post for every chunk concurrently.
+
+    The style sheet is read once (from `style_file`, unless `style_content`
+    is given) and shared by every request as a cached prompt prefix. At most
+    `concurrency` requests run at once.
+
+    Returns:
+      One dict per chunk, in chunk order: {'index', 'post', 'error'}. On
+      success 'error' is None; on failure 'post' is None and 'error' is
+      {'type', 'message', 'status'} describing the last error.
+    """
+    if style_content is None:
+        style_content = load_style(style_file) if style_file else None
+    if not style_content:
+        raise ValueError("Failed to read style file.")
+
+    chunks = list(chunks)
+    if not chunks:
+        return []
+    concurrency = concurrency or GENERATION_CONCURRENCY
+
+    def run(index):
+        try:
+            return {'index': index, 'post': generate_post(style_content, chunks[index], max_retries), 'error': None}
+        except Exception as e:
+            print(f"Error generating content for chunk {index}: {e}")
+            return {'index': index, 'post': None,
+                    'error': {'type': type(e).__name__, 'message': str(e),
+                              'status': getattr(e, 'status_code', None)}}
 
+    # The first request writes the style prefix to the prompt cache; the rest
+    # start once it has, so they read it instead of each writing it again.
+    results = [run(0)]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks))) as pool:
+        results.extend(pool.map(metrics.bind(run), range(1, len(chunks))))
 
+    failed = sum(1 for result in results if result['error'] is not None)
+    print(f"Generated {len(results) - failed} post(s), {failed} failure(s).")
+    return results
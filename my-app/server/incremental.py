@@ -0,0 +1,211 @@
+"""
+Incremental re-chunking of edited transcripts.
+
+Users often fix a few labels or typos and upload the same transcript again.
+For semantic chunking, each document's target-speaker utterance hashes and
+the similarity of every adjacent pair are stored after a run. On the next
+upload of that document the new utterances are diffed against the stored
+ones; similarities between two utterances that were already neighbours are
+reused, and only the gaps touching an edit are recomputed. So only edited
+utterances (and their immediate neighbours, usually from the embedding
+cache) are embedded. Boundaries are re-derived from the similarities, and
+the verdict cache then re-scores only the chunks whose text changed.
+
+The diff needs every utterance of the new version, so the file is parsed in
+full first; the stale gaps are then embedded a batch at a time in transcript
+order, and each chunk is yielded as soon as the gaps up to its end are known.
+
+The diff is content-based, so reusing another document's state is never
+wrong, only less useful. State files are kept under
+INCREMENTAL_STATE_MAX_BYTES in total; the least recently used documents are
+forgotten first.
+"""
+
+import hashlib
+import os
+import threading
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from chunk_transcript import _target_lines, _check_cancelled, size_segments, encode_normalized
+from embedding_cache import text_hash
+
+INCREMENTAL_STATE_DIR = os.getenv('INCREMENTAL_STATE_DIR', os.path.join('cache', 'documents'))
+INCREMENTAL_STATE_MAX_BYTES = int(os.getenv('INCREMENTAL_STATE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+_state_lock = threading.Lock()
+
+def _state_path(document_id, model_id):
+    digest = hashlib.sha1(f"{model_id}:{document_id}".encode('utf-8')).hexdigest()
+    return os.path.join(INCREMENTAL_STATE_DIR, f"{digest}.npz")
+
+def has_state(document_id, model_id):
+    return bool(INCREMENTAL_STATE_DIR) and os.path.exists(_state_path(document_id, model_id))
+
+def load_state(document_id, model_id):
+    """Stored (hashes, similarities) for a document, or None. Marks the state as recently used."""
+    path = _state_path(document_id, model_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            state = [h.decode('ascii') for h in data['hashes']], data['similarities']
+        os.utime(path)
+        return state
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable incremental state {path}: {e}")
+        return None
+
+def save_state(document_id, model_id, hashes, similarities, max_bytes=INCREMENTAL_STATE_MAX_BYTES):
+    os.makedirs(INCREMENTAL_STATE_DIR, exist_ok=True)
+    path = _state_path(document_id, model_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez(tmp_path, hashes=np.array(hashes, dtype='S40'), similarities=similarities.astype(np.float32))
+    with _state_lock:
+        os.replace(tmp_path, path)
+        if max_bytes:
+            _evict(max_bytes)
+
+def _evict(max_bytes):
+    """Delete the least recently used state files until the rest fit in `max_bytes`."""
+    entries = []
+    with os.scandir(INCREMENTAL_STATE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith('.npz') and '.tmp' not in entry.name:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def match_utterances(old_hashes, new_hashes):
+    """
+    Map each new utterance index to the index of the identical utterance in
+    the previous version, or -1 for inserted/edited ones. The common prefix
+    and suffix are matched directly, so the diff itself only runs over the
+    edited region.
+    """
+    n_old, n_new = len(old_hashes), len(new_hashes)
+    mapping = np.full(n_new, -1, dtype=np.int64)
+
+    prefix = 0
+    while prefix < min(n_old, n_new) and old_hashes[prefix] == new_hashes[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < min(n_old, n_new) - prefix
+           and old_hashes[n_old - 1 - suffix] == new_hashes[n_new - 1 - suffix]):
+        suffix += 1
+
+    mapping[:prefix] = np.arange(prefix)
+    if suffix:
+        mapping[n_new - suffix:] = np.arange(n_old - suffix, n_old)
+
+    old_mid = old_hashes[prefix:n_old - suffix]
+    new_mid = new_hashes[prefix:n_new - suffix]
+    if old_mid and new_mid:
+        matcher = SequenceMatcher(None, old_mid, new_mid, autojunk=False)
+        for old_start, new_start, size in matcher.get_matching_blocks():
+            mapping[prefix + new_start:prefix + new_start + size] = np.arange(prefix + old_start,
+                                                                               prefix + old_start + size)
+    return mapping
+
+def _reused_similarities(hashes, previous):
+    """
+    Adjacent-pair similarities for utterances with `hashes`, filled in from
+    `previous` (hashes, similarities) wherever both utterances of a pair were
+    neighbours before. Returns (similarities, stale gap mask, mapping).
+    """
+    n = len(hashes)
+    similarities = np.empty(max(n - 1, 0), dtype=np.float32)
+    if previous is None:
+        return similarities, np.ones(len(similarities), dtype=bool), np.full(n, -1, dtype=np.int64)
+    old_hashes, old_similarities = previous
+    mapping = match_utterances(old_hashes, hashes)
+    left, right = mapping[:-1], mapping[1:]
+    stale = (left < 0) | (right != left + 1)
+    reused = ~stale
+    similarities[reused] = old_similarities[left[reused]]
+    return similarities, stale, mapping
+
+def iter_chunk_incremental(transcript_data, document_id, model_id, target_label="austin kennedy", threshold=0.6,
+                           model=None, embedding_cache=None, min_tokens=0, max_tokens=0, progress=None,
+                           encode_batch_size=64, cancel_event=None):
+    """
+    Semantic chunking (same output as chunk_by_semantic) that reuses the
+    stored state of `document_id` from its previous run, yielding each chunk
+    as soon as its boundaries are known. The new state is stored once the
+    last chunk has been produced. `progress(stage, **info)` receives
+    'incremental' with reuse counts; setting `cancel_event` stops it with
+    ChunkingCancelled before the next batch is embedded.
+    """
+    target_lines = _target_lines(transcript_data, target_label)
+    if not target_lines:
+        print("No Austin Kennedy lines found. Check transcript format or speaker label.")
+        return
+
+    hashes = [text_hash(line) for line in target_lines]
+    similarities, stale, mapping = _reused_similarities(hashes, load_state(document_id, model_id))
+    gaps = np.flatnonzero(stale)
+    stats = {
+        'utterances': len(target_lines),
+        'reused_utterances': int(np.count_nonzero(mapping >= 0)),
+        'embedded_utterances': 0,
+        'recomputed_gaps': len(gaps)
+    }
+    computed = 0  # stale gaps whose similarity is known
+
+    def compute_batch():
+        # Embed the utterances around the next stale gaps, up to a batch of them
+        nonlocal computed
+        _check_cancelled(cancel_event)
+        batch = []
+        needed = []
+        while computed + len(batch) < len(gaps):
+            gap = int(gaps[computed + len(batch)])
+            new = [i for i in (gap, gap + 1) if not needed or i > needed[-1]]
+            if batch and len(needed) + len(new) > encode_batch_size:
+                break
+            batch.append(gap)
+            needed.extend(new)
+        embeddings = encode_normalized(model, [target_lines[i] for i in needed], embedding_cache=embedding_cache)
+        position = {i: k for k, i in enumerate(needed)}
+        for gap in batch:
+            similarities[gap] = float(np.dot(embeddings[position[gap]], embeddings[position[gap + 1]]))
+        computed += len(batch)
+        stats['embedded_utterances'] += len(needed)
+
+    def segments():
+        start = 0
+        for gap in range(len(similarities)):
+            if stale[gap] and computed < len(gaps) and gap >= gaps[computed]:
+                compute_batch()
+            if similarities[gap] < threshold:
+                yield target_lines[start:gap + 1], target_lines[start:gap + 1], similarities[start:gap]
+                start = gap + 1
+        yield target_lines[start:], target_lines[start:], similarities[start:]
+
+    for lines in size_segments(segments(), min_tokens, max_tokens):
+        yield " ".join(lines)
+
+    save_state(document_id, model_id, hashes, similarities)
+    print(f"Incremental chunking: {stats['reused_utterances']}/{stats['utterances']} utterances unchanged, "
+          f"{stats['recomputed_gaps']} boundary gap(s) recomputed.")
+    if progress is not None:
+        progress('incremental', **stats)
+
+def chunk_incremental(transcript_data, document_id, model_id, target_label="austin kennedy", threshold=0.6,
+                      model=None, embedding_cache=None, min_tokens=0, max_tokens=0, progress=None):
+    """Like iter_chunk_incremental, but returns the list of chunks."""
+    return list(iter_chunk_incremental(transcript_data, document_id, model_id, target_label=target_label,
+                                       threshold=threshold, model=model, embedding_cache=embedding_cache,
+                                       min_tokens=min_tokens, max_tokens=max_tokens, progress=progress))
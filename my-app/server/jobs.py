@@ -0,0 +1,232 @@
+"""
+Background jobs for the upload pipeline.
+
+POST /jobs hands the uploaded transcript to a JobManager, which runs
+pipeline.iter_pipeline on a bounded worker pool and records progress events
+that the app streams to clients over Server-Sent Events. Finished archives are
+kept on disk until the job expires.
+"""
+
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline import iter_pipeline, write_zip, pipeline_config, PipelineError, PipelineCancelled
+from result_cache import get_result_cache, file_digest, make_key as make_result_key
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', '8'))
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', '3600'))
+# Jobs outlive the request that created them, so they keep their own folders
+JOB_UPLOAD_FOLDER = os.getenv('JOB_UPLOAD_FOLDER', os.path.join('jobs', 'uploads'))
+JOB_RESULT_FOLDER = os.getenv('JOB_RESULT_FOLDER', os.path.join('jobs', 'results'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its limit."""
+
+class Job:
+    """
+    State of one pipeline run. Events are recorded under `condition` so that
+    SSE readers can block until something new happens. Only the latest event
+    of each stage is kept, so a long job's history stays as small as its
+    number of stages; event ids keep increasing, and a reader that resumes
+    past a replaced event still gets its newer version.
+    """
+    def __init__(self, input_path, document_id=None, filename=None):
+        self.id = uuid.uuid4().hex
+        self.input_path = input_path
+        self.document_id = document_id
+        self.filename = filename
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.progress = {}
+        self.error = None
+        self.result_path = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = OrderedDict()  # stage -> (id, event), oldest id first
+        self.next_event_id = 0
+        self.condition = threading.Condition()
+        self.cancel_event = threading.Event()
+
+    def _record(self, stage, event):
+        # Called with `condition` held
+        self.events.pop(stage, None)
+        self.events[stage] = (self.next_event_id, event)
+        self.next_event_id += 1
+        self.condition.notify_all()
+
+    def emit(self, stage, **info):
+        with self.condition:
+            self.stage = stage
+            self.progress = info
+            self._record(stage, {'stage': stage, 'status': self.status, **info})
+
+    def finish(self, status, error=None):
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._record(status, {'stage': status, 'status': status, **({'error': error} if error else {})})
+
+    def to_dict(self):
+        with self.condition:
+            return {
+                'id': self.id,
+                'filename': self.filename,
+                'status': self.status,
+                'stage': self.stage,
+                'progress': self.progress,
+                'error': self.error,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at
+            }
+
+    def wait_for_events(self, start, timeout=15):
+        """
+        Return ([(id, event)] for ids >= start, finished). Blocks up to
+        `timeout` seconds when there is nothing new, so callers can send
+        keep-alives.
+        """
+        with self.condition:
+            if self.next_event_id <= start and self.status not in FINISHED_STATES:
+                self.condition.wait(timeout)
+            events = [(event_id, event) for event_id, event in self.events.values() if event_id >= start]
+            return events, self.status in FINISHED_STATES
+
+class JobManager:
+    """
+    Runs pipeline jobs on a thread pool.
+
+    Parameters:
+      - workers: number of jobs processed at once
+      - max_queued: jobs allowed to wait beyond the running ones; submit()
+        raises QueueFullError past that
+      - ttl: seconds a finished job (and its archive) is kept
+    """
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED,
+                 ttl=JOB_TTL_SECONDS, upload_folder=JOB_UPLOAD_FOLDER, result_folder=JOB_RESULT_FOLDER):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.upload_folder = upload_folder
+        self.result_folder = result_folder
+        os.makedirs(upload_folder, exist_ok=True)
+        os.makedirs(result_folder, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def input_path(self):
+        """
+        A unique path in the job upload folder for an incoming transcript. The
+        client's filename never becomes part of it; keep it as Job.filename.
+        """
+        return os.path.join(self.upload_folder, f"{uuid.uuid4().hex}.txt")
+
+    def submit(self, input_path, document_id=None, filename=None):
+        """
+        Queue the transcript at `input_path`; the job owns (and deletes) that
+        file. `document_id` enables incremental re-chunking (see iter_pipeline);
+        `filename` is the name the client uploaded it under.
+        """
+        self.prune()
+        with self.lock:
+            active = sum(1 for job in self.jobs.values() if job.status in (QUEUED, RUNNING))
+            if active >= self.workers + self.max_queued:
+                raise QueueFullError(f"{active} jobs already queued or running")
+            job = Job(input_path, document_id=document_id, filename=filename)
+            self.jobs[job.id] = job
+        job.emit(QUEUED)
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Request cancellation. Returns the job, or None if it doesn't exist."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        # A job still waiting in the queue never reaches the pipeline's checks
+        with job.condition:
+            if job.status == QUEUED:
+                job.finish(CANCELLED)
+        return job
+
+    def _run(self, job):
+        try:
+            with job.condition:
+                if job.status != QUEUED:
+                    return
+                job.status = RUNNING
+            job.emit('started')
+
+            result_path = os.path.join(self.result_folder, f"{job.id}.zip")
+
+            # An identical upload under the same configuration was already processed
+            result_cache = get_result_cache()
+            result_key = None
+            if result_cache is not None:
+                result_key = make_result_key(file_digest(job.input_path), pipeline_config())
+                cached = result_cache.open(result_key)
+                if cached is not None:
+                    f, _, size = cached
+                    with f, open(result_path, 'wb') as out:
+                        shutil.copyfileobj(f, out)
+                    job.result_path = result_path
+                    job.emit('packaged', bytes=size, cached=True)
+                    job.finish(SUCCEEDED)
+                    return
+
+            # Accepted chunks are written into the archive as soon as they're known
+            try:
+                size = write_zip(iter_pipeline(job.input_path, progress=job.emit, cancel_event=job.cancel_event,
+                                               document_id=job.document_id),
+                                 result_path)
+            except Exception:
+                if os.path.exists(result_path):
+                    os.remove(result_path)
+                raise
+            if result_key:
+                result_cache.put(result_key, result_path, copy=True)
+            job.result_path = result_path
+            job.emit('packaged', bytes=size)
+            job.finish(SUCCEEDED)
+        except PipelineCancelled:
+            job.finish(CANCELLED)
+        except PipelineError as e:
+            job.finish(FAILED, error=f"{e.message}: {e.details}" if e.details else e.message)
+        except Exception as e:
+            traceback.print_exc()
+            job.finish(FAILED, error=f"Internal server error: {e}")
+        finally:
+            if os.path.exists(job.input_path):
+                os.remove(job.input_path)
+
+    def prune(self):
+        """Forget finished jobs older than the TTL and delete their archives."""
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            expired = [job for job in self.jobs.values()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            if job.result_path and os.path.exists(job.result_path):
+                os.remove(job.result_path)
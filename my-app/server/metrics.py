@@ -0,0 +1,338 @@
+"""
+Process-wide metrics and per-request traces.
+
+Counters and histograms are kept in memory and rendered in the Prometheus
+text format by GET /metrics. They cover:
+
+  - pipeline_stage_seconds / pipeline_stage_items_total: time spent in and
+    items produced by each stage (parse, chunk, embed, dedup, length_filter,
+    prefilter, filter, zip)
+  - llm_request_seconds / llm_tokens_total / llm_retries_total: every API
+    attempt, by provider and operation, with prompt, completion and
+    cached-prompt token counts
+  - cache_lookups_total: hits and misses of the verdict, embedding and
+    result caches
+  - http_request_seconds: Flask request latency by endpoint
+
+The pipeline stages are chained generators, so one `next()` on the last
+stage runs all the earlier ones. Stage timers share a per-thread stack and
+each records only its exclusive time: a chunker's time excludes the parser
+and the embedding calls it drives, and the filter's time is what it spent
+waiting on the LLM. Each gunicorn worker keeps its own counters; scrape each
+worker or aggregate them upstream.
+
+A request sent with `X-Trace: 1` (or `?trace=1`) also gets a trace: the
+spans of every timed stage and LLM call made on its behalf, kept in memory
+for the last METRICS_TRACE_KEEP requests and served at /traces/<id>.
+"""
+
+import bisect
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+METRICS_TRACE_KEEP = int(os.getenv('METRICS_TRACE_KEEP', '100'))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_REGISTRY = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_label_text(self.labels, key)} {value}" for key, value in items]
+
+class Histogram:
+    """Observations bucketed by upper bound, with their count and sum, per label combination."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # key -> [bucket counts..., count, sum]
+        self.lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 2)
+            if position < len(self.buckets):
+                state[position] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def render(self):
+        with self.lock:
+            items = sorted((key, list(state)) for key, state in self.values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labels, key, [('le', '+Inf')])} {state[-2]}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {state[-2]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {state[-1]:.6f}")
+        return lines
+
+STAGE_SECONDS = Histogram('pipeline_stage_seconds', "Time spent in a pipeline stage per run, excluding nested stages.",
+                          ('stage',))
+STAGE_ITEMS = Counter('pipeline_stage_items_total', "Items produced by each pipeline stage.", ('stage',))
+LLM_SECONDS = Histogram('llm_request_seconds', "Latency of each LLM API attempt.",
+                        ('provider', 'operation', 'outcome'))
+LLM_TOKENS = Counter('llm_tokens_total', "LLM tokens by kind (prompt, completion, cached_prompt).",
+                     ('provider', 'kind'))
+LLM_RETRIES = Counter('llm_retries_total', "LLM attempts retried after a retryable error.", ('provider',))
+CACHE_LOOKUPS = Counter('cache_lookups_total', "Cache lookups by cache and result (hit or miss).",
+                        ('cache', 'result'))
+HTTP_SECONDS = Histogram('http_request_seconds', "Flask request latency until the response is returned.",
+                         ('endpoint', 'status'))
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ---------------------------------------------------------------------------
+# Traces
+# ---------------------------------------------------------------------------
+
+class Trace:
+    """Spans recorded for one request, as offsets from its start."""
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, name, start, seconds, **attrs):
+        span = {'name': name, 'offset_s': round(start - self.origin, 6), 'seconds': round(seconds, 6)}
+        span.update(attrs)
+        with self.lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span['offset_s'])
+        totals = {}
+        for span in spans:
+            totals[span['name']] = totals.get(span['name'], 0.0) + span['seconds']
+        return {
+            'id': self.id,
+            'name': self.name,
+            'started_at': self.started,
+            'totals_s': {name: round(seconds, 6) for name, seconds in totals.items()},
+            'spans': spans
+        }
+
+_traces = OrderedDict()
+_traces_lock = threading.Lock()
+_local = threading.local()
+
+def start_trace(name):
+    """Create a trace and keep it (evicting the oldest beyond METRICS_TRACE_KEEP)."""
+    trace = Trace(name)
+    with _traces_lock:
+        _traces[trace.id] = trace
+        while len(_traces) > METRICS_TRACE_KEEP:
+            _traces.popitem(last=False)
+    return trace
+
+def get_trace(trace_id):
+    with _traces_lock:
+        return _traces.get(trace_id)
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+def set_trace(trace):
+    """Make `trace` current on this thread (None clears it); returns the previous one."""
+    previous = current_trace()
+    _local.trace = trace
+    return previous
+
+@contextmanager
+def activate(trace):
+    """Record spans on this thread into `trace` (None records none) until exit."""
+    previous = set_trace(trace)
+    try:
+        yield trace
+    finally:
+        set_trace(previous)
+
+def bind(fn):
+    """
+    Wrap `fn` so that, run on another thread (e.g. in a pool), it records
+    into the trace active where bind() was called.
+    """
+    trace = current_trace()
+    if trace is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        with activate(trace):
+            return fn(*args, **kwargs)
+    return bound
+
+# ---------------------------------------------------------------------------
+# Timers
+# ---------------------------------------------------------------------------
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _push():
+    frame = [time.perf_counter(), 0.0]
+    _stack().append(frame)
+    return frame
+
+def _pop(frame):
+    """Close `frame`; returns its exclusive seconds and charges its total to the enclosing frame."""
+    stack = _stack()
+    elapsed = time.perf_counter() - frame[0]
+    stack.remove(frame)
+    if stack:
+        stack[-1][1] += elapsed
+    return elapsed - frame[1]
+
+def record_stage(stage, seconds, items=None, start=None):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if items is not None:
+        STAGE_ITEMS.inc(items, stage=stage)
+    trace = current_trace()
+    if trace is not None:
+        attrs = {'items': items} if items is not None else {}
+        trace.add(stage, start if start is not None else time.perf_counter() - seconds, seconds, **attrs)
+
+@contextmanager
+def stage(name, items=None):
+    """Time the enclosed block as one run of stage `name`, excluding nested stages."""
+    frame = _push()
+    try:
+        yield
+    finally:
+        record_stage(name, _pop(frame), items=items, start=frame[0])
+
+def timed_iter(iterable, name, count=True):
+    """
+    Pass `iterable` through, recording the exclusive time spent producing its
+    items (and, with `count`, how many there were) as one run of stage `name`
+    once it is exhausted or closed. Closing the wrapper closes `iterable`.
+    """
+    iterator = iter(iterable)
+    busy = 0.0
+    items = 0
+    started = time.perf_counter()
+    try:
+        while True:
+            frame = _push()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                busy += _pop(frame)
+            items += 1
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+        record_stage(name, busy, items=items if count else None, start=started)
+
+def record_items(name, count):
+    """Count items produced by stage `name` when its time is recorded elsewhere."""
+    STAGE_ITEMS.inc(count, stage=name)
+
+# ---------------------------------------------------------------------------
+# LLM calls and caches
+# ---------------------------------------------------------------------------
+
+def record_llm_request(provider, operation, seconds, outcome='ok', prompt_tokens=0, completion_tokens=0,
+                       cached_tokens=0, start=None):
+    """One API attempt: its latency, outcome and token usage."""
+    LLM_SECONDS.observe(seconds, provider=provider, operation=operation, outcome=outcome)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, provider=provider, kind='prompt')
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, provider=provider, kind='completion')
+    if cached_tokens:
+        LLM_TOKENS.inc(cached_tokens, provider=provider, kind='cached_prompt')
+    trace = current_trace()
+    if trace is not None:
+        trace.add(f"llm.{provider}.{operation}", start if start is not None else time.perf_counter() - seconds,
+                  seconds, outcome=outcome, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                  cached_tokens=cached_tokens)
+
+@contextmanager
+def llm_request(provider, operation):
+    """
+    Time one API attempt. The block sets `usage` on the yielded dict
+    (prompt_tokens, completion_tokens, cached_tokens) once it has them; an
+    exception is recorded as outcome 'error' and re-raised.
+    """
+    call = {}
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield call
+        outcome = 'ok'
+    finally:
+        record_llm_request(provider, operation, time.perf_counter() - start, outcome=outcome, start=start,
+                           **call.get('usage', {}))
+
+def record_retry(provider):
+    LLM_RETRIES.inc(provider=provider)
+
+def record_cache(cache, hits=0, misses=0):
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result='miss')
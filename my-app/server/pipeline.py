@@ -0,0 +1,231 @@
+"""
+The upload pipeline: chunk a transcript, drop near-duplicate chunks, filter
+the rest, zip the survivors.
+
+Shared by the blocking /upload route and the background job workers in
+jobs.py. The stages are chained generators: chunks are yielded as their
+boundaries are found, scored while later chunks are still being embedded,
+and accepted chunks go straight into the ZIP. Stages report through an
+optional `progress(stage, **info)` callback and stop early once
+`cancel_event` is set.
+"""
+
+import io
+import json
+import os
+import zipfile
+
+import chunking_service
+import metrics
+from dedup import iter_dedup_chunks, DEDUP_THRESHOLD
+from filter_chunks import iter_filter_chunks, LLMFilterError, FilterCancelled, FILTER_MODEL, PROMPT_VERSION
+from prefilter import get_prefilter
+
+# Minimum LLM score (max over categories) for a chunk to be kept
+FILTER_THRESHOLD = float(os.getenv('FILTER_THRESHOLD', '2.5'))
+
+# ZIP entry compression: 'deflated' or 'stored' (no compression; the chunk
+# files are small text and barely shrink). ZIP_COMPRESSLEVEL is 0-9 for deflate.
+ZIP_COMPRESSION = os.getenv('ZIP_COMPRESSION', 'deflated')
+ZIP_COMPRESSLEVEL = int(os.getenv('ZIP_COMPRESSLEVEL', '6'))
+
+_COMPRESSION_METHODS = {
+    'deflated': zipfile.ZIP_DEFLATED,
+    'stored': zipfile.ZIP_STORED
+}
+
+def _zip_settings(compression, compresslevel):
+    """(method, compresslevel) for zipfile; raises ValueError on unsupported settings."""
+    if compression not in _COMPRESSION_METHODS:
+        raise ValueError(f"Unsupported ZIP compression: {compression} "
+                         f"(expected one of {', '.join(_COMPRESSION_METHODS)})")
+    if not 0 <= compresslevel <= 9:
+        raise ValueError(f"Unsupported ZIP compression level: {compresslevel} (expected 0-9)")
+    method = _COMPRESSION_METHODS[compression]
+    return method, (None if method == zipfile.ZIP_STORED else compresslevel)
+
+# Fail at startup rather than in the middle of the first archive
+_zip_settings(ZIP_COMPRESSION, ZIP_COMPRESSLEVEL)
+
+# Entry describing a failure that happened after the archive had started
+ERROR_ENTRY = 'error.json'
+
+class PipelineError(Exception):
+    """A pipeline failure that maps onto an HTTP error response."""
+    def __init__(self, message, status=500, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details
+
+class PipelineCancelled(Exception):
+    """The pipeline was stopped through its cancel event."""
+
+def pipeline_config():
+    """
+    Every setting besides the upload itself that determines the archive, for
+    keying the result cache (see result_cache.py).
+    """
+    prefilter = get_prefilter()
+    return {
+        'method': chunking_service.CHUNK_METHOD,
+        'threshold': chunking_service.CHUNK_THRESHOLD,
+        'window': chunking_service.CHUNK_WINDOW,
+        'target_label': chunking_service.TARGET_LABEL.lower(),
+        'interviewer_label': chunking_service.INTERVIEWER_LABEL.lower(),
+        'min_tokens': chunking_service.CHUNK_MIN_TOKENS,
+        'max_tokens': chunking_service.CHUNK_MAX_TOKENS,
+        'embedding_model': chunking_service.EMBEDDING_MODEL_ID,
+        'dedup_threshold': DEDUP_THRESHOLD,
+        'filter_model': FILTER_MODEL,
+        'prompt_version': PROMPT_VERSION,
+        'filter_threshold': FILTER_THRESHOLD,
+        'prefilter': [prefilter.weights, prefilter.bias, prefilter.threshold] if prefilter is not None else None,
+        'zip': [ZIP_COMPRESSION, ZIP_COMPRESSLEVEL]
+    }
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise PipelineCancelled()
+
+def iter_pipeline(file_path, progress=None, cancel_event=None, document_id=None):
+    """
+    Chunk, deduplicate and filter the transcript at `file_path`, yielding
+    accepted chunks in transcript order as soon as each one is known.
+    `document_id` names the document across uploads so an edited transcript
+    is re-chunked incrementally.
+
+    Raises PipelineError or PipelineCancelled (possibly after some chunks
+    have already been yielded).
+    """
+    def report(stage, **info):
+        if progress is not None:
+            progress(stage, **info)
+
+    counts = {'chunks': 0, 'accepted': 0}
+
+    def chunked():
+        # Chunk the transcript in-process with the shared model
+        try:
+            for chunk in chunking_service.iter_chunk_file(file_path, progress=report, document_id=document_id,
+                                                          cancel_event=cancel_event):
+                counts['chunks'] += 1
+                yield chunk
+        except chunking_service.ChunkingCancelled:
+            raise PipelineCancelled()
+        except RuntimeError as e:
+            print(f"Chunking error: {e}")
+            raise PipelineError("Error in chunking process", 500, str(e))
+        print(f"Total chunks created: {counts['chunks']}")
+        report('chunked', chunks=counts['chunks'])
+
+    # Drop restated material, then remove irrelevant chunks as they arrive
+    try:
+        unique = metrics.timed_iter(iter_dedup_chunks(chunked(), progress=report), 'dedup')
+        accepted = iter_filter_chunks(unique, threshold=FILTER_THRESHOLD, progress=report, cancel_event=cancel_event)
+        for chunk in metrics.timed_iter(accepted, 'filter'):
+            counts['accepted'] += 1
+            yield chunk
+    except FilterCancelled:
+        raise PipelineCancelled()
+    except LLMFilterError as e:
+        print(f"LLM filtering error: {e}")
+        raise PipelineError("Error scoring chunks", 502, str(e))
+
+    _check_cancelled(cancel_event)
+
+    if not counts['chunks']:
+        print("No chunks were generated.")
+        raise PipelineError("No content generated from the transcript", 500)
+
+    print(f"Total filtered chunks: {counts['accepted']}")
+    report('filtered', chunks=counts['accepted'])
+
+    if not counts['accepted']:
+        raise PipelineError("No meaningful content found after filtering.", 400)
+
+def run_pipeline(file_path, progress=None, cancel_event=None, document_id=None):
+    """
+    Chunk and filter the transcript at `file_path`.
+
+    Returns:
+      The filtered chunks (strings), in transcript order.
+    Raises PipelineError or PipelineCancelled.
+    """
+    return list(iter_pipeline(file_path, progress=progress, cancel_event=cancel_event, document_id=document_id))
+
+class _ZipSink(io.RawIOBase):
+    """
+    Write-only, non-seekable buffer for ZipFile. zipfile falls back to data
+    descriptors on unseekable output, so each entry can be handed on as soon
+    as it is written and the buffer drained.
+    """
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+def iter_zip(filtered_chunks, compression=None, compresslevel=None, report_errors=False):
+    """
+    Yield a ZIP archive with one filtered_chunk_N.txt entry per chunk, piece
+    by piece. Only one entry is held in memory at a time, so peak memory does
+    not grow with the number of chunks. Timed as the 'zip' stage, counting
+    entries.
+
+    With `report_errors`, a PipelineError raised by `filtered_chunks` is
+    written into the archive as an ERROR_ENTRY (`error`, `status`, `details`
+    and the number of `chunks` before it), the archive is closed so it stays
+    readable, and the error is re-raised after the last part.
+    """
+    method, compresslevel = _zip_settings(compression or ZIP_COMPRESSION,
+                                          ZIP_COMPRESSLEVEL if compresslevel is None else compresslevel)
+    return metrics.timed_iter(_iter_zip(filtered_chunks, method, compresslevel, report_errors), 'zip',
+                              count=False)
+
+def _iter_zip(filtered_chunks, method, compresslevel, report_errors):
+    sink = _ZipSink()
+    error = None
+    with zipfile.ZipFile(sink, 'w', method, compresslevel=compresslevel) as zip_file:
+        chunks = iter(filtered_chunks)
+        idx = 0
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            except PipelineError as e:
+                if not report_errors:
+                    raise
+                error = e
+                zip_file.writestr(ERROR_ENTRY, json.dumps({
+                    'error': e.message, 'status': e.status, 'details': e.details, 'chunks': idx
+                }))
+                break
+            idx += 1
+            zip_file.writestr(f"filtered_chunk_{idx}.txt", chunk.encode('utf-8'))
+            yield sink.drain()
+        metrics.record_items('zip', idx)
+    # Central directory, written when the archive closes
+    yield sink.drain()
+    if error is not None:
+        raise error
+
+def write_zip(filtered_chunks, path, compression=None, compresslevel=None):
+    """Stream the archive for `filtered_chunks` to `path`; returns its size in bytes."""
+    size = 0
+    with open(path, 'wb') as f:
+        for part in iter_zip(filtered_chunks, compression, compresslevel):
+            f.write(part)
+            size += len(part)
+    return size
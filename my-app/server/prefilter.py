@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Cheap local pre-filter that runs before the LLM filter.
+
+Scores each chunk from text signals (numeric and statistic density, narrative
+markers, filler-word ratio and length) with a small logistic model. Chunks
+scoring below the confidence threshold are rejected without an API call.
+
+The model is calibrated from the verdict log that filter_chunks appends to
+whenever the LLM scores a chunk. The log holds each chunk's hash and features,
+not its text, and is rotated once it reaches VERDICT_LOG_MAX_BYTES (the
+previous file is kept as <path>.1, so at most twice that is on disk):
+
+    python prefilter.py --log cache/verdict_log.jsonl --out cache/prefilter.json
+
+A small share of local rejects is still sent to the LLM as an audit, so the
+agreement rate between the two stays visible in production.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+
+PREFILTER_MODEL_PATH = os.getenv('PREFILTER_MODEL_PATH', os.path.join('cache', 'prefilter.json'))
+VERDICT_LOG_PATH = os.getenv('VERDICT_LOG_PATH', os.path.join('cache', 'verdict_log.jsonl'))
+VERDICT_LOG_MAX_BYTES = int(os.getenv('VERDICT_LOG_MAX_BYTES', str(64 * 1024 * 1024)))
+# Share of locally rejected chunks still sent to the LLM to measure agreement
+PREFILTER_AUDIT_RATE = float(os.getenv('PREFILTER_AUDIT_RATE', '0.05'))
+
+_NUMBER = re.compile(r"\d")
+_STAT_WORDS = re.compile(
+    r"\b(percent|percentage|million|billion|thousand|hundred|double|triple|half|average|"
+    r"revenue|growth|data|study|survey|research|\d+x|\d+%)\b|[%$]", re.IGNORECASE)
+_NARRATIVE = re.compile(
+    r"\b(i remember|when i|when we|i was|we were|i had|i realized|i learned|years ago|"
+    r"one day|story|the first time|back then|my (dad|mom|father|mother|first|friend|boss|team))\b",
+    re.IGNORECASE)
+_FILLER = re.compile(
+    r"\b(um+|uh+|like|you know|i mean|kind of|sort of|yeah|okay|right|basically|literally)\b",
+    re.IGNORECASE)
+
+def extract_features(chunk_text):
+    """Local signals for one chunk, as a dict of floats."""
+    words = chunk_text.split()
+    n = max(len(words), 1)
+    return {
+        "numeric_density": sum(1 for w in words if _NUMBER.search(w)) / n,
+        "statistic_density": len(_STAT_WORDS.findall(chunk_text)) / n,
+        "narrative_density": len(_NARRATIVE.findall(chunk_text)) / n,
+        "filler_ratio": len(_FILLER.findall(chunk_text)) / n,
+        "log_length": math.log(n)
+    }
+
+FEATURES = ("numeric_density", "statistic_density", "narrative_density", "filler_ratio", "log_length")
+
+class PreFilter:
+    """
+    Logistic model over extract_features(). `predict` gives the estimated
+    probability that the LLM would accept a chunk; `keep` applies the
+    confidence threshold. Tracks how many API calls it saved and how often it
+    agreed with the LLM on chunks both of them judged.
+    """
+    def __init__(self, weights, bias, threshold, audit_rate=PREFILTER_AUDIT_RATE):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.lock = threading.Lock()
+        self.seen = 0
+        self.skipped = 0
+        self.compared = 0
+        self.agreed = 0
+
+    @classmethod
+    def load(cls, path=PREFILTER_MODEL_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["weights"], data["bias"], data["threshold"])
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"weights": self.weights, "bias": self.bias, "threshold": self.threshold}, f, indent=2)
+
+    def predict(self, chunk_text):
+        return self.predict_features(extract_features(chunk_text))
+
+    def predict_features(self, features):
+        z = self.bias + sum(self.weights.get(name, 0.0) * features[name] for name in FEATURES)
+        return 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0)))
+
+    def keep(self, chunk_text):
+        """
+        Return (send_to_llm, predicted_pass). A chunk below the threshold is
+        still sent to the LLM with probability `audit_rate` so agreement on
+        rejects can be measured.
+        """
+        predicted_pass = self.predict(chunk_text) >= self.threshold
+        send = predicted_pass or random.random() < self.audit_rate
+        with self.lock:
+            self.seen += 1
+            if not send:
+                self.skipped += 1
+        return send, predicted_pass
+
+    def record_llm_verdict(self, predicted_pass, llm_passed):
+        """Count agreement for a chunk that was judged both locally and by the LLM."""
+        with self.lock:
+            self.compared += 1
+            if predicted_pass == llm_passed:
+                self.agreed += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "seen": self.seen,
+                "api_calls_saved": self.skipped,
+                "compared": self.compared,
+                "agreement_rate": self.agreed / self.compared if self.compared else None
+            }
+
+_prefilter = None
+_prefilter_lock = threading.Lock()
+
+def get_prefilter():
+    """
+    Process-wide pre-filter loaded from PREFILTER_MODEL_PATH, or None when no
+    calibrated model exists (the stage is then skipped).
+    """
+    global _prefilter
+    if not PREFILTER_MODEL_PATH or not os.path.exists(PREFILTER_MODEL_PATH):
+        return None
+    with _prefilter_lock:
+        if _prefilter is None:
+            _prefilter = PreFilter.load(PREFILTER_MODEL_PATH)
+            print(f"Loaded pre-filter from {PREFILTER_MODEL_PATH} (threshold {_prefilter.threshold:.3f}).")
+    return _prefilter
+
+_log_lock = threading.Lock()
+
+def log_verdicts(entries, path=None, max_bytes=VERDICT_LOG_MAX_BYTES):
+    """
+    Append LLM verdicts as JSON Lines for later calibration. `entries` is an
+    iterable of (chunk_text, scores, passed); each line stores the text's
+    hash and features, never the text. Once the log exceeds `max_bytes` it is
+    moved to <path>.1 (replacing the previous one) and a new log is started.
+    Disabled when VERDICT_LOG_PATH is set to an empty string.
+    """
+    path = VERDICT_LOG_PATH if path is None else path
+    if not path:
+        return
+    lines = [json.dumps({"hash": hashlib.sha1(text.encode('utf-8')).hexdigest(),
+                         "features": extract_features(text), "scores": scores, "passed": passed})
+             for text, scores, passed in entries]
+    if not lines:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _log_lock:
+        try:
+            if max_bytes and os.path.getsize(path) >= max_bytes:
+                os.replace(path, f"{path}.1")
+        except FileNotFoundError:
+            pass
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+def calibrate(examples, target_recall=0.98, epochs=300, learning_rate=0.5):
+    """
+    Fit a PreFilter on `examples`, a list of (features, passed) pairs with
+    features as returned by extract_features.
+
+    Trains logistic regression with batch gradient descent on standardized
+    features, then picks the highest threshold that still keeps
+    `target_recall` of the LLM-accepted chunks.
+    """
+    rows = [features for features, _ in examples]
+    labels = [1.0 if passed else 0.0 for _, passed in examples]
+    if not rows or len(set(labels)) < 2:
+        raise ValueError("Calibration needs both accepted and rejected examples.")
+
+    means = {f: sum(r[f] for r in rows) / len(rows) for f in FEATURES}
+    stds = {f: math.sqrt(sum((r[f] - means[f]) ** 2 for r in rows) / len(rows)) or 1.0 for f in FEATURES}
+    xs = [[(r[f] - means[f]) / stds[f] for f in FEATURES] for r in rows]
+
+    w = [0.0] * len(FEATURES)
+    b = 0.0
+    for _ in range(epochs):
+        grad_w = [0.0] * len(FEATURES)
+        grad_b = 0.0
+        for x, y in zip(xs, labels):
+            z = b + sum(wi * xi for wi, xi in zip(w, x))
+            p = 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0)))
+            for i, xi in enumerate(x):
+                grad_w[i] += (p - y) * xi
+            grad_b += p - y
+        w = [wi - learning_rate * g / len(xs) for wi, g in zip(w, grad_w)]
+        b -= learning_rate * grad_b / len(xs)
+
+    # Fold the standardization back into raw-feature weights
+    weights = {f: w[i] / stds[f] for i, f in enumerate(FEATURES)}
+    bias = b - sum(w[i] * means[f] / stds[f] for i, f in enumerate(FEATURES))
+
+    model = PreFilter(weights, bias, threshold=0.0)
+    positive_scores = sorted(model.predict_features(features) for features, passed in examples if passed)
+    cut = int(math.floor((1.0 - target_recall) * len(positive_scores)))
+    model.threshold = positive_scores[min(cut, len(positive_scores) - 1)]
+    return model
+
+def read_verdict_log(path):
+    """(features, passed) pairs from the log at `path` and its rotated predecessor, oldest first."""
+    examples = []
+    for log_path in (f"{path}.1", path):
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    # Logs written before features were stored hold the text instead
+                    features = record["features"] if "features" in record else extract_features(record["text"])
+                    examples.append((features, bool(record["passed"])))
+    return examples
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the local pre-filter from logged LLM verdicts.")
+    parser.add_argument("--log", type=str, default=VERDICT_LOG_PATH,
+                        help="Verdict log written by filter_chunks (JSON Lines).")
+    parser.add_argument("--out", type=str, default=PREFILTER_MODEL_PATH,
+                        help="Where to write the calibrated pre-filter.")
+    parser.add_argument("--target_recall", type=float, default=0.98,
+                        help="Share of LLM-accepted chunks the pre-filter must keep.")
+    args = parser.parse_args()
+
+    examples = read_verdict_log(args.log)
+    model = calibrate(examples, target_recall=args.target_recall)
+    model.save(args.out)
+
+    kept = [model.predict_features(features) >= model.threshold for features, _ in examples]
+    agreement = sum(1 for k, (_, passed) in zip(kept, examples) if k == passed) / len(examples)
+    saved = sum(1 for k in kept if not k) / len(examples)
+    print(f"Calibrated on {len(examples)} verdicts: threshold {model.threshold:.3f}, "
+          f"would skip {saved:.0%} of LLM calls, agreement {agreement:.0%}.")
+    print(f"Pre-filter written to '{args.out}'.")
+
+if __name__ == "__main__":
+    main()
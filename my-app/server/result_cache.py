@@ -0,0 +1,178 @@
+"""
+Content-addressed store of finished pipeline archives.
+
+A result is keyed by the SHA-256 of the uploaded bytes plus the pipeline
+configuration (see pipeline.pipeline_config), so re-uploading an identical
+transcript (users often retry after a timeout) returns the stored ZIP
+without chunking, scoring or packaging it again. Archives live as files in
+one directory with a SQLite index recording size and last use; the least
+recently used ones are evicted once the total exceeds the byte budget.
+Each entry's strong ETag is the SHA-256 of the archive bytes.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import metrics
+
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join('cache', 'results'))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+_KEY = re.compile(r'^[0-9a-f]{64}$')
+
+def file_digest(path):
+    """SHA-256 hex digest of the file at `path`, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_key(upload_digest, config):
+    """Cache key for an upload's digest under a pipeline configuration dict."""
+    payload = json.dumps(config, sort_keys=True)
+    return hashlib.sha256(f"{upload_digest}:{payload}".encode('utf-8')).hexdigest()
+
+def is_valid_key(key):
+    return bool(_KEY.match(key))
+
+class ResultCache:
+    """
+    Size-bounded LRU store of archives.
+
+    Parameters:
+      - directory: where archives and the index live; created if missing
+      - max_bytes: total archive size kept; least recently used entries
+        beyond it are deleted
+    """
+    def __init__(self, directory=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " etag TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.conn.commit()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.zip")
+
+    def open(self, key):
+        """
+        Return (file object, etag, size) for a stored archive, or None. The
+        file is opened before returning, so a concurrent eviction can't
+        remove it from under the caller.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT etag, size FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                try:
+                    f = open(self.path_for(key), 'rb')
+                except FileNotFoundError:
+                    self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    row = None
+                else:
+                    self.conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+            if row is None:
+                self.misses += 1
+                metrics.record_cache('result', misses=1)
+                return None
+            self.hits += 1
+            metrics.record_cache('result', hits=1)
+        return f, row[0], row[1]
+
+    def temp_path(self):
+        """A fresh path inside the cache directory for writing an archive to be put()."""
+        fd, path = tempfile.mkstemp(suffix='.zip.tmp', dir=self.directory)
+        os.close(fd)
+        return path
+
+    def put(self, key, archive_path, etag=None, copy=False):
+        """
+        Store the archive at `archive_path` under `key` (moved in, or copied
+        when `copy` is set) and evict old entries if over budget. Returns the
+        entry's ETag.
+        """
+        etag = etag or file_digest(archive_path)
+        size = os.path.getsize(archive_path)
+        if size > self.max_bytes:
+            if not copy:
+                os.remove(archive_path)
+            return etag
+        if copy:
+            tmp = self.temp_path()
+            shutil.copyfile(archive_path, tmp)
+            archive_path = tmp
+        os.replace(archive_path, self.path_for(key))
+
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, etag, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, etag, size, now, now)
+            )
+            self._evict()
+            self.conn.commit()
+        return etag
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        """Hit/miss counters for this process plus the stored entries and bytes."""
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """
+    Process-wide cache instance, or None when RESULT_CACHE_DIR is set to an
+    empty string to disable caching.
+    """
+    global _cache
+    if not RESULT_CACHE_DIR:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+    return _cache
@@ -0,0 +1,117 @@
+"""
+Parallel /upload requests against a stub OpenAI server.
+
+Requests run on their own threads inside one process, as they do under a
+threaded gunicorn worker, and share the process-wide model, filter engines,
+rate-limit buckets and caches. Every response must be a complete archive
+identical to the one produced for the same transcript by a solo upload with
+the caches bypassed, and the caches must stay readable and consistent
+afterwards.
+"""
+
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import StubLLMServer, make_transcript
+
+UPLOADS_PER_DOCUMENT = 6
+
+@pytest.fixture(scope='module')
+def env():
+    """The app, imported against the stub server with caches in a temporary directory."""
+    stub = StubLLMServer('openai', latency=0.01, seed=1).start()
+    root = tempfile.mkdtemp(prefix='test-uploads-')
+    settings = {
+        'OPENAI_BASE_URL': f"{stub.url}/v1",
+        'OPENAI_API_KEY': 'test',
+        'CHUNK_METHOD': 'qa',
+        'WARM_MODEL_ON_STARTUP': '0',
+        'VERDICT_CACHE_PATH': os.path.join(root, 'verdicts.sqlite'),
+        'VERDICT_LOG_PATH': '',
+        'PREFILTER_MODEL_PATH': '',
+        'EMBEDDING_CACHE_DIR': '',
+        'INCREMENTAL_STATE_DIR': '',
+        'RESULT_CACHE_DIR': os.path.join(root, 'results'),
+        'WORKSPACE_ROOT': os.path.join(root, 'workspaces'),
+        'OPENAI_REQUESTS_PER_MINUTE': '0',
+        'OPENAI_TOKENS_PER_MINUTE': '0',
+    }
+    saved = {key: os.environ.get(key) for key in settings}
+    os.environ.update(settings)
+    try:
+        import app as flask_app
+        transcripts = [make_transcript(os.path.join(root, f"transcript-{seed}.txt"), 300, seed=seed)
+                       for seed in (1, 2)]
+        yield flask_app.app, transcripts, root
+    finally:
+        stub.stop()
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def upload(app, path):
+    with open(path, 'rb') as f:
+        response = app.test_client().post('/upload', data={'contentFile': (f, os.path.basename(path))},
+                                          content_type='multipart/form-data')
+    return response.status_code, response.get_data()
+
+def entries(archive):
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        return {name: zf.read(name) for name in zf.namelist()}
+
+def test_parallel_uploads(env, monkeypatch):
+    app, transcripts, root = env
+
+    # Baselines: each transcript uploaded alone, without reading or writing
+    # the caches, so the parallel burst below still starts cold
+    import app as flask_app
+    import filter_chunks
+    with monkeypatch.context() as patch:
+        patch.setattr(flask_app, 'get_result_cache', lambda: None)
+        patch.setattr(filter_chunks, 'get_verdict_cache', lambda: None)
+        baselines = {}
+        for path in transcripts:
+            status, body = upload(app, path)
+            assert status == 200, body[:200]
+            baselines[path] = entries(body)
+            assert baselines[path], f"no chunks accepted for {path}"
+    assert baselines[transcripts[0]] != baselines[transcripts[1]]
+
+    jobs = [path for path in transcripts for _ in range(UPLOADS_PER_DOCUMENT)]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        results = list(pool.map(lambda path: upload(app, path), jobs))
+
+    for status, body in results:
+        assert status == 200, body[:200]
+
+    for path, (_, body) in zip(jobs, results):
+        assert entries(body) == baselines[path]
+
+    # The caches were written by every request at once and must still be whole
+    with sqlite3.connect(os.path.join(root, 'verdicts.sqlite')) as conn:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        assert conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0] > 0
+
+    from result_cache import get_result_cache
+    stats = get_result_cache().stats()
+    assert stats['entries'] == len(transcripts)
+    assert stats['hits'] == 0
+
+    # Repeat uploads are served from those caches and give the same archives
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        repeated = list(pool.map(lambda path: upload(app, path), jobs))
+    for path, (status, body) in zip(jobs, repeated):
+        assert status == 200
+        assert entries(body) == baselines[path]
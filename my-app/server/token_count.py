@@ -0,0 +1,59 @@
+"""
+Local token counting for chunk sizing and request budgeting.
+
+Uses tiktoken with the encoding of the OpenAI filter model when it is
+installed, so counts match what the API bills. Without it (or when its
+encoding files cannot be loaded offline) counts fall back to a
+regex estimate of the same BPE pre-tokenisation: one token per short
+word, number group or punctuation mark, and more for long words.
+"""
+
+import os
+import re
+import threading
+
+try:
+    import tiktoken
+    _HAS_TIKTOKEN = True
+except ImportError:
+    _HAS_TIKTOKEN = False
+
+TOKEN_ENCODING = os.getenv('TOKEN_ENCODING', 'o200k_base')
+
+_PIECE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if not _HAS_TIKTOKEN or _encoding_failed:
+        return None
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    _encoding_failed = True
+                    print(f"Note: tiktoken encoding '{TOKEN_ENCODING}' unavailable ({e}); estimating token counts.")
+    return _encoding
+
+def approximate_tokens(text):
+    """Tokenizer-free estimate; words longer than eight letters count as several tokens."""
+    return sum(1 + (len(piece) - 1) // 8 if piece.isalpha() else 1 for piece in _PIECE.findall(text))
+
+def count_tokens(text):
+    """Number of tokens in `text`."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode_ordinary(text))
+    return approximate_tokens(text)
+
+def count_tokens_many(texts):
+    """Token counts for a list of texts, batched through tiktoken when available."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(list(texts))]
+    return [approximate_tokens(text) for text in texts]
@@ -0,0 +1,144 @@
+"""
+Persistent, content-addressed cache of LLM filter verdicts.
+
+Entries are keyed by the hash of the normalized chunk text plus the model,
+prompt version and threshold, so re-uploading the same (or an overlapping)
+transcript skips the API for every chunk it has already seen. Backed by
+SQLite in WAL mode, so several worker processes can share one file.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+VERDICT_CACHE_PATH = os.getenv('VERDICT_CACHE_PATH', os.path.join('cache', 'verdicts.sqlite'))
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv('VERDICT_CACHE_MAX_ENTRIES', '100000'))
+VERDICT_CACHE_MAX_AGE_DAYS = float(os.getenv('VERDICT_CACHE_MAX_AGE_DAYS', '90'))
+
+def normalize_text(text):
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return " ".join(text.split())
+
+def make_key(chunk_text, model, prompt_version, threshold):
+    digest = hashlib.sha256(normalize_text(chunk_text).encode('utf-8')).hexdigest()
+    return f"{digest}:{model}:{prompt_version}:{threshold}"
+
+class VerdictCache:
+    """
+    SQLite-backed verdict store with LRU (max entries) and age-based eviction.
+
+    Parameters:
+      - path: database file; parent directories are created
+      - max_entries: least recently used entries beyond this are evicted
+      - max_age_days: entries older than this are treated as misses and evicted
+    """
+    def __init__(self, path=VERDICT_CACHE_PATH, max_entries=VERDICT_CACHE_MAX_ENTRIES,
+                 max_age_days=VERDICT_CACHE_MAX_AGE_DAYS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " key TEXT PRIMARY KEY,"
+            " scores TEXT NOT NULL,"
+            " passed INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """
+        Look up `keys` and return {key: (scores, passed)} for the ones cached.
+        Updates hit/miss counters and last-used times.
+        """
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT key, scores, passed, created_at FROM verdicts WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                for key, scores, passed, created_at in rows:
+                    if self.max_age and now - created_at > self.max_age:
+                        continue
+                    found[key] = (json.loads(scores), bool(passed))
+            if found:
+                self.conn.executemany(
+                    "UPDATE verdicts SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self.conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, entries):
+        """Store an iterable of (key, scores, passed) and evict if over budget."""
+        now = time.time()
+        rows = [(key, json.dumps(scores), int(passed), now, now) for key, scores, passed in entries]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, scores, passed, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        if self.max_age:
+            self.conn.execute("DELETE FROM verdicts WHERE created_at < ?", (now - self.max_age,))
+        if self.max_entries:
+            self.conn.execute(
+                "DELETE FROM verdicts WHERE key IN ("
+                " SELECT key FROM verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current entry count."""
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": size
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_verdict_cache():
+    """
+    Process-wide cache instance, or None when VERDICT_CACHE_PATH is set to an
+    empty string to disable caching.
+    """
+    global _cache
+    if not VERDICT_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = VerdictCache()
+    return _cache